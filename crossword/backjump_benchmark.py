@@ -0,0 +1,54 @@
+import sys
+import time
+
+from crossword import Crossword
+from generate import CrosswordCreator, SearchLimitReached
+
+# Seconds each search may run for before it is reported as timed out
+TIME_LIMIT = 60
+
+
+def main():
+
+    # Check usage
+    if len(sys.argv) < 3 or len(sys.argv) % 2 == 0:
+        sys.exit("Usage: python backjump_benchmark.py "
+                 "structure words [structure words ...]")
+
+    print(f"{'structure':<28}{'search':<16}{'result':<10}"
+          f"{'nodes':>10}{'backjumps':>11}{'nogoods':>9}{'seconds':>10}")
+    for k in range(1, len(sys.argv), 2):
+        structure, words = sys.argv[k], sys.argv[k + 1]
+        for name, backjumping in [("chronological", False),
+                                  ("backjumping", True)]:
+            result = run(structure, words, backjumping)
+            print(f"{structure:<28}{name:<16}{result['result']:<10}"
+                  f"{result['nodes']:>10}{result['backjumps']:>11}"
+                  f"{result['nogoods']:>9}{result['seconds']:>10.3f}")
+
+
+def run(structure, words, backjumping):
+    """
+    Solve the crossword in `structure` with `words`, with or without
+    conflict-directed backjumping, and return a dict of statistics.
+    """
+    creator = CrosswordCreator(Crossword(structure, words))
+    creator.backjumping = backjumping
+    creator.deadline = time.monotonic() + TIME_LIMIT
+    start = time.perf_counter()
+    try:
+        assignment = creator.solve()
+        result = "solved" if assignment is not None else "none"
+    except SearchLimitReached:
+        result = "timeout"
+    return {
+        "result": result,
+        "nodes": creator.nodes,
+        "backjumps": creator.backjumps,
+        "nogoods": sum(len(n) for n in creator.nogoods.values()),
+        "seconds": time.perf_counter() - start
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from crossword import Crossword
+from generate import CrosswordCreator, SearchLimitReached
+
+# Approximate frequencies (percent) of letters in English words, used to
+# draw synthetic vocabularies
+LETTER_FREQUENCIES = {
+    "A": 8.2, "B": 1.5, "C": 2.8, "D": 4.3, "E": 12.7, "F": 2.2, "G": 2.0,
+    "H": 6.1, "I": 7.0, "J": 0.2, "K": 0.8, "L": 4.0, "M": 2.4, "N": 6.7,
+    "O": 7.5, "P": 1.9, "Q": 0.1, "R": 6.0, "S": 6.3, "T": 9.1, "U": 2.8,
+    "V": 1.0, "W": 2.4, "X": 0.2, "Y": 2.0, "Z": 0.1
+}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the crossword solver on random grids."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 7, 9],
+                        help="grid side lengths")
+    parser.add_argument("--densities", type=float, nargs="+",
+                        default=[0.2, 0.3],
+                        help="fractions of black squares")
+    parser.add_argument("--trials", type=int, default=3,
+                        help="grids per size and density")
+    parser.add_argument("--words", default="data/words2.txt",
+                        help="words file to subsample")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="number of words to subsample from --words")
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="use this many random words instead of --words")
+    parser.add_argument("--time-limit", type=float, default=10,
+                        help="seconds each search may run for")
+    parser.add_argument("--chronological", action="store_true",
+                        help="disable conflict-directed backjumping")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="JSON file to write results to")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+
+        # One vocabulary is shared by every grid
+        words_file = os.path.join(directory, "words.txt")
+        if args.synthetic is not None:
+            words = synthetic_words(args.synthetic, 3, max(args.sizes), rng)
+        else:
+            words = sample_words(args.words, args.sample, rng)
+        write_lines(words_file, words)
+
+        for size in args.sizes:
+            for density in args.densities:
+                for trial in range(args.trials):
+                    structure = random_structure(size, size, density, rng)
+                    structure_file = os.path.join(directory, "structure.txt")
+                    write_lines(structure_file, structure)
+                    result = run(
+                        structure_file, words_file,
+                        time_limit=args.time_limit,
+                        backjumping=not args.chronological
+                    )
+                    result.update({
+                        "size": size,
+                        "density": density,
+                        "trial": trial,
+                        "structure": structure
+                    })
+                    results.append(result)
+                    print(f"{size:>3}x{size:<3} density {density:.2f} "
+                          f"trial {trial}: {result['result']:<8}"
+                          f"{result['nodes']:>8} nodes "
+                          f"{result['seconds']['total']:>8.3f}s",
+                          file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "words": args.words if args.synthetic is None else None,
+        "vocabulary": len(words),
+        "synthetic": args.synthetic is not None,
+        "time_limit": args.time_limit,
+        "backjumping": not args.chronological,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def run(structure_file, words_file, time_limit=None, backjumping=True):
+    """
+    Solve one crossword, timing each phase separately, and return a dict of
+    the result, counters and timings.
+    """
+    seconds = dict()
+    start = time.perf_counter()
+    crossword = Crossword(structure_file, words_file)
+    creator = CrosswordCreator(crossword)
+    creator.backjumping = backjumping
+    seconds["load"] = time.perf_counter() - start
+
+    phase = time.perf_counter()
+    creator.enforce_node_consistency()
+    seconds["node_consistency"] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    consistent = creator.ac3()
+    seconds["arc_consistency"] = time.perf_counter() - phase
+    domain_sizes = [len(domain) for domain in creator.domains.values()]
+    initial_arcs = creator.arcs_processed
+    initial_revise_calls = creator.revise_calls
+
+    phase = time.perf_counter()
+    result = "none"
+    if consistent:
+        creator.trail.clear()
+        if time_limit is not None:
+            creator.deadline = time.monotonic() + time_limit
+        try:
+            if creator.backtrack(dict()) is not None:
+                result = "solved"
+        except SearchLimitReached:
+            result = "timeout"
+    seconds["search"] = time.perf_counter() - phase
+    seconds["total"] = time.perf_counter() - start
+
+    return {
+        "result": result,
+        "variables": len(crossword.variables),
+        "domain_sizes": {
+            "min": min(domain_sizes, default=0),
+            "max": max(domain_sizes, default=0),
+            "mean": sum(domain_sizes) / len(domain_sizes) if domain_sizes else 0
+        },
+        "initial_revise_calls": initial_revise_calls,
+        "initial_arcs_processed": initial_arcs,
+        "revise_calls": creator.revise_calls,
+        "arcs_processed": creator.arcs_processed,
+        "nodes": creator.nodes,
+        "backtracks": creator.backtracks,
+        "backjumps": creator.backjumps,
+        "seconds": seconds
+    }
+
+
+def random_structure(height, width, density, rng):
+    """
+    Return the rows of a random crossword structure with about `density`
+    of its squares black, symmetric under 180 degree rotation.
+    """
+    black = [[False] * width for _ in range(height)]
+    for i in range(height):
+        for j in range(width):
+            if (i, j) <= (height - 1 - i, width - 1 - j):
+                if rng.random() < density:
+                    black[i][j] = True
+                    black[height - 1 - i][width - 1 - j] = True
+    return ["".join("#" if cell else "_" for cell in row) for row in black]
+
+
+def sample_words(words_file, count, rng):
+    """
+    Return the words in `words_file`, or a random sample of `count` of them.
+    """
+    with open(words_file) as f:
+        words = sorted(set(f.read().upper().splitlines()) - {""})
+    if count is not None and count < len(words):
+        words = sorted(rng.sample(words, count))
+    return words
+
+
+def synthetic_words(count, shortest, longest, rng):
+    """
+    Return `count` distinct random words of `shortest` to `longest` letters,
+    with letters drawn using English letter frequencies.
+    """
+    letters = list(LETTER_FREQUENCIES)
+    weights = list(LETTER_FREQUENCIES.values())
+    words = set()
+    while len(words) < count:
+        length = rng.randint(shortest, longest)
+        words.add("".join(rng.choices(letters, weights, k=length)))
+    return sorted(words)
+
+
+def write_lines(filename, lines):
+    """Write `lines` to `filename`, one per line."""
+    with open(filename, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
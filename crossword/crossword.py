@@ -1,3 +1,6 @@
+from wordindex import WordIndex, is_index
+
+
 class Variable():
 
     ACROSS = "across"
@@ -57,9 +60,12 @@ class Crossword():
                         row.append(False)
                 self.structure.append(row)
 
-        # Save vocabulary list
-        with open(words_file) as f:
-            self.words = set(f.read().upper().splitlines())
+        # Save vocabulary list, memory-mapping it if it has been indexed
+        if is_index(words_file):
+            self.words = WordIndex(words_file)
+        else:
+            with open(words_file) as f:
+                self.words = set(f.read().upper().splitlines())
 
         # Determine variable set
         self.variables = set()
@@ -104,30 +110,47 @@ class Crossword():
                             length=length
                         ))
 
+        # Index which variables cover each cell, so overlaps can be found
+        # without comparing every pair of variables
+        cell_index = dict()
+        for v in self.variables:
+            for k, cell in enumerate(v.cells):
+                cell_index.setdefault(cell, []).append((v, k))
+
         # Compute overlaps for each word
         # For any pair of variables v1, v2, their overlap is either:
         #    None, if the two variables do not overlap; or
         #    (i, j), where v1's ith character overlaps v2's jth character
-        self.overlaps = dict()
-        for v1 in self.variables:
-            for v2 in self.variables:
-                if v1 == v2:
-                    continue
-                cells1 = v1.cells
-                cells2 = v2.cells
-                intersection = set(cells1).intersection(cells2)
-                if not intersection:
-                    self.overlaps[v1, v2] = None
-                else:
-                    intersection = intersection.pop()
-                    self.overlaps[v1, v2] = (
-                        cells1.index(intersection),
-                        cells2.index(intersection)
-                    )
+        self.overlaps = Overlaps()
+        neighbor_lists = {v: [] for v in self.variables}
+        for covering in cell_index.values():
+            for v1, k1 in covering:
+                for v2, k2 in covering:
+                    if v1 == v2:
+                        continue
+                    self.overlaps[v1, v2] = (k1, k2)
+                    neighbor_lists[v1].append((v2, (k1, k2)))
+
+        # Store each variable's neighbors along with their overlaps, so
+        # neighbor queries never need to scan the variable set
+        self.neighbor_overlaps = {
+            v: tuple(neighbor_lists[v]) for v in self.variables
+        }
+        self._neighbors = {
+            v: frozenset(n for n, _ in neighbor_lists[v])
+            for v in self.variables
+        }
 
     def neighbors(self, var):
         """Given a variable, return set of overlapping variables."""
-        return set(
-            v for v in self.variables
-            if v != var and self.overlaps[v, var]
-        )
+        return self._neighbors[var]
+
+
+class Overlaps(dict):
+    """
+    Mapping from pairs of variables to their overlap. Only overlapping pairs
+    are stored; looking up any other pair returns None.
+    """
+
+    def __missing__(self, key):
+        return None
@@ -1,19 +1,101 @@
+import argparse
+import os
+import random
 import sys
+import time
 
 from crossword import *
 from collections import deque
+from render import Renderer, render_batch
+from wordindex import WordIndex
+
+# Largest number of assignments in a learned nogood
+NOGOOD_SIZE = 2
+
+
+class SearchLimitReached(Exception):
+    """
+    Raised when a search runs past its node limit or deadline, or is
+    cancelled through its stop event.
+    """
+
 
 class CrosswordCreator():
 
-    def __init__(self, crossword):
+    def __init__(self, crossword, seed=None):
         """
         Create new CSP crossword generate.
+        If `seed` is given, ties in variable and value ordering are broken
+        at random using that seed; otherwise ordering is deterministic.
         """
         self.crossword = crossword
-        self.domains = {
-            var: self.crossword.words.copy()
-            for var in self.crossword.variables
+        if isinstance(self.crossword.words, WordIndex):
+            # Indexed vocabularies are bucketed by length, so each domain
+            # starts out with only the words that fit
+            self.domains = {
+                var: set(self.crossword.words.words(var.length))
+                for var in self.crossword.variables
+            }
+        else:
+            self.domains = {
+                var: self.crossword.words.copy()
+                for var in self.crossword.variables
+            }
+
+        # Renderer for `save`, created when first needed
+        self.renderer = None
+
+        # Stack of (variable, value) domain removals and (variable, None,
+        # explanation) explanation changes, undone on backtrack
+        self.trail = []
+
+        # Words used by the assignment currently being searched, mapped to
+        # the variable using them
+        self.used_words = dict()
+
+        # Per-variable [domain, size, counts] entries, where counts[k] maps
+        # each letter to the number of words in the domain with that letter
+        # at position k. Kept in step with the domains by remove_value/undo.
+        self.letter_count_cache = dict()
+
+        # Solutions already found when enumerating diverse solutions, and
+        # how many slots the current assignment shares with each of them
+        self.min_difference = 0
+        self.previous = []
+        self.agreements = []
+
+        # Conflict-directed backjumping. `choices` holds the variables chosen
+        # on the current search path. `explanations` maps each variable to
+        # the choices that caused removals from its domain, and `reasons`
+        # maps each assigned variable to the choices that forced its value.
+        # Learned nogoods map a (variable, value) pair to the assignments it
+        # is incompatible with, or to None if it is part of no solution.
+        self.backjumping = True
+        self.choices = []
+        self.explanations = {
+            var: frozenset() for var in self.crossword.variables
         }
+        self.reasons = dict()
+        self.nogoods = dict()
+        self.failure = None
+        self.wipeout = None
+        self.backjumps = 0
+
+        # Work counters: calls to revise, arcs taken off the AC-3 queue and
+        # values undone after their branch of the search failed
+        self.revise_calls = 0
+        self.arcs_processed = 0
+        self.backtracks = 0
+
+        # Tie-breaking for variable and value ordering
+        self.random = random.Random(seed) if seed is not None else None
+
+        # Search nodes expanded, and optional limits on the search. When a
+        # limit is hit, SearchLimitReached is raised out of `backtrack`.
+        self.nodes = 0
+        self.node_limit = None
+        self.deadline = None
+        self.stop = None
 
     def letter_grid(self, assignment):
         """
@@ -46,52 +128,42 @@ class CrosswordCreator():
 
     def save(self, assignment, filename):
         """
-        Save crossword assignment to an image file.
+        Save crossword assignment to an image file, or to an SVG or text
+        file if `filename` ends in .svg or .txt.
         """
-        from PIL import Image, ImageDraw, ImageFont
-        cell_size = 100
-        cell_border = 2
-        interior_size = cell_size - 2 * cell_border
-        letters = self.letter_grid(assignment)
-
-        # Create a blank canvas
-        img = Image.new(
-            "RGBA",
-            (self.crossword.width * cell_size,
-             self.crossword.height * cell_size),
-            "black"
-        )
-        font = ImageFont.truetype("assets/fonts/OpenSans-Regular.ttf", 80)
-        draw = ImageDraw.Draw(img)
-
-        for i in range(self.crossword.height):
-            for j in range(self.crossword.width):
-
-                rect = [
-                    (j * cell_size + cell_border,
-                     i * cell_size + cell_border),
-                    ((j + 1) * cell_size - cell_border,
-                     (i + 1) * cell_size - cell_border)
-                ]
-                if self.crossword.structure[i][j]:
-                    draw.rectangle(rect, fill="white")
-                    if letters[i][j]:
-                        _, _, w, h = draw.textbbox((0, 0), letters[i][j], font=font)
-                        draw.text(
-                            (rect[0][0] + ((interior_size - w) / 2),
-                             rect[0][1] + ((interior_size - h) / 2) - 10),
-                            letters[i][j], fill="black", font=font
-                        )
-
-        img.save(filename)
+        if self.renderer is None:
+            self.renderer = Renderer(self.crossword.structure)
+        self.renderer.save(self.letter_grid(assignment), filename)
 
     def solve(self):
         """
         Enforce node and arc consistency, and then solve the CSP.
         """
+        return next(self.solutions(), None)
+
+    def solutions(self, min_difference=0):
+        """
+        Enforce node and arc consistency, and then lazily yield distinct
+        complete assignments from a single backtracking search.
+
+        If `min_difference` is positive, every solution differs from all
+        previously yielded ones in at least that many slots; partial
+        assignments that can no longer do so are pruned.
+        """
         self.enforce_node_consistency()
-        self.ac3()
-        return self.backtrack(dict())
+        if not self.ac3():
+            return
+
+        # Removals made before the search starts are never undone
+        self.trail.clear()
+        self.used_words = dict()
+        self.choices = []
+        self.nogoods = dict()
+        self.min_difference = min_difference
+        self.previous = []
+        self.agreements = []
+        for assignment in self.search(dict()):
+            yield dict(assignment)
 
     def enforce_node_consistency(self):
         """
@@ -120,20 +192,20 @@ class CrosswordCreator():
     #         revised = true
     # return revised
 
+        self.revise_calls += 1
         revised = False
         overlaps = self.crossword.overlaps[X, Y]
         if not overlaps:
             return revised
+        i, j = overlaps
+        letters_y = self.letter_counts(Y)[j]
         possible_x = self.domains[X].copy()
         for x in possible_x:
-            viable_y = False
-            for y in self.domains[Y]:
-                i, j = overlaps
-                if x[i] == y[j]:
-                    viable_y = True
-            if not viable_y:
-                self.domains[X].remove(x)
+            if not letters_y.get(x[i]):
+                self.remove_value(X, x)
                 revised = True
+        if revised:
+            self.explain(X, self.explanations[Y])
         return revised
                 
 
@@ -160,20 +232,20 @@ class CrosswordCreator():
     #         for each Z in X.neighbors - {Y}:
     #             Enqueue(queue, (Z,X))
     # return true
-        variables = list(self.crossword.variables)
-        n = len(variables)
         if arcs is not None:
             queue = deque(arcs)
         else:
-            queue = deque()
-            for i in range(n):
-                for j in range(i+1, n):
-                    v1, v2 = variables[i], variables[j]
-                    queue.append((v1, v2))
+            queue = deque(
+                (X, Y)
+                for X, neighbors in self.crossword.neighbor_overlaps.items()
+                for Y, _ in neighbors
+            )
         while queue:
             X, Y = queue.popleft()
+            self.arcs_processed += 1
             if self.revise(X, Y):
                 if len(self.domains[X]) == 0:
+                    self.wipeout = X
                     return False
                 for Z in self.crossword.neighbors(X):
                     if Z != Y:
@@ -220,16 +292,22 @@ class CrosswordCreator():
         The first value in the list, for example, should be the one
         that rules out the fewest values among the neighbors of `var`.
         """
+        # A value rules out every word in a neighbor's domain that has a
+        # different letter at their overlap
+        constraints = [
+            (i, len(self.domains[neighbor]), self.letter_counts(neighbor)[j])
+            for neighbor, (i, j) in self.crossword.neighbor_overlaps[var]
+            if neighbor not in assignment
+        ]
         map_to_n = dict()
         for d in self.domains[var]:
             n = 0
-            for neighbor in self.crossword.neighbors(var):
-                if neighbor not in assignment:
-                    i, j = self.crossword.overlaps[var, neighbor]
-                    for d2 in self.domains[neighbor]:
-                        if d[i] != d2[j]:
-                            n += 1
+            for i, size, letters in constraints:
+                n += size - letters.get(d[i], 0)
             map_to_n[d] = n
+        if self.random is not None:
+            ties = {d: self.random.random() for d in map_to_n}
+            return sorted(map_to_n, key=lambda x : (map_to_n[x], ties[x]))
         return sorted(list(self.domains[var]), key=lambda x : map_to_n[x])
 
                     
@@ -246,6 +324,8 @@ class CrosswordCreator():
         """
         # (mRV, -degree)
         unassigned_variables = [v for v in self.crossword.variables if v not in assignment]
+        if self.random is not None:
+            self.random.shuffle(unassigned_variables)
         unassigned_variables.sort(key=lambda x : (len(self.domains[x]), -len(self.crossword.neighbors(x))))
         return unassigned_variables[0]
 
@@ -256,8 +336,12 @@ class CrosswordCreator():
         crossword and return a complete assignment if possible to do so.
 
         `assignment` is a mapping from variables (keys) to words (values).
+        It is extended in place and restored on backtrack, as are the
+        domains, using the trail of removals.
 
-        If no assignment is possible, return None.
+        If no assignment is possible, return None. If a node limit, deadline
+        or stop event is set and trips, SearchLimitReached is raised and the
+        creator should be discarded, as its domains are left mid-search.
         """
         
 # if assignment complete:
@@ -277,63 +361,334 @@ class CrosswordCreator():
 #             return result
 #         remove {var = value} and inferences from assignment
 # return failure
-        def Inference(assignment, X):
-            exit_value = self.ac3(arcs=[(Y, X) for Y in self.crossword.neighbors(X)])
-            inferences = dict()
-            if not exit_value:
-                return exit_value, inferences
-            for v in self.domains:
-                if v not in assignment and len(self.domains[v]) == 1:
-                    inferences[v] = next(iter(self.domains[v]))
-            return exit_value, inferences
-        def my_backtrack(assignment):
-            if self.assignment_complete(assignment):
-                return True, assignment
-            var = self.select_unassigned_variable(assignment)
-            for value in self.order_domain_values(var, assignment):
-                new_assignment = assignment.copy()
-                new_assignment[var] = value
-                if self.consistent(new_assignment):
-                    assignment[var] = value
-                    exit_val, inferences = Inference(assignment, var)
-                    if exit_val:
-                        assignment = {**assignment, **inferences}
-                    success, result = my_backtrack(assignment)
-                    if success:
-                        return success, result
-                    del assignment[var]
-                    assignment = {k : v for k, v in assignment.items() if k not in inferences}
-            return False, None
-        is_success, answer = my_backtrack(assignment)
-        return answer if is_success else None
-
-            
+        self.used_words = {value: var for var, value in assignment.items()}
+        for var in assignment:
+            self.reasons[var] = frozenset()
+        return next(self.search(assignment), None)
 
+    def search(self, assignment):
+        """
+        Recursive step of `backtrack`, yielding `assignment` each time it is
+        complete. `self.used_words` must hold exactly the words in
+        `assignment`; both are restored once the generator is exhausted.
+
+        The generator returns the conflict set of the subtree: the chosen
+        variables whose values explain why it holds no (further) solution.
+        If the variable chosen here is not in the conflict set of one of its
+        values, trying its other values cannot help, so the search jumps
+        straight back to the most recent variable that is.
+        """
+        if self.previous and self.too_similar():
+            return set(self.choices)
+        if self.assignment_complete(assignment):
+            if self.min_difference > 0:
+                self.previous.append(dict(assignment))
+                self.agreements.append(len(assignment))
+            yield assignment
+            return set(self.choices)
+        self.count_node()
+        var = self.select_unassigned_variable(assignment)
+        self.choices.append(var)
+        conflict = set()
+        for value in self.order_domain_values(var, assignment):
+            culprits = self.conflicts(var, value, assignment)
+            if culprits is None:
+                self.check_limits()
+                self.reasons[var] = frozenset([var])
+                self.assign(var, value, assignment)
+                mark = len(self.trail)
+                inferences = self.inference(assignment, var)
+                if inferences is None:
+                    culprits = self.failure
+                else:
+                    culprits = yield from self.search(assignment)
+                    for v in inferences:
+                        self.unassign(v, assignment)
+                self.undo(mark)
+                self.unassign(var, assignment)
+                self.backtracks += 1
+                if not self.backjumping:
+                    culprits = set(self.choices)
+                if var not in culprits:
+                    self.choices.pop()
+                    self.backjumps += 1
+                    return culprits
+                culprits = culprits - {var}
+            conflict |= culprits
+        self.choices.pop()
+
+        # Values missing from the domain of `var` were removed because of
+        # earlier choices, which are part of the conflict too
+        conflict |= self.explanations[var]
+        conflict.discard(var)
+        self.learn(conflict, assignment)
+        return conflict
+
+    def learn(self, conflict, assignment):
+        """
+        Record the current values of the variables in `conflict` as a
+        nogood if it has at most NOGOOD_SIZE of them, so that the same
+        combination is rejected wherever it comes up again.
+        """
+        if not self.backjumping or not conflict or len(conflict) > NOGOOD_SIZE:
+            return
+        pairs = [(var, assignment[var]) for var in conflict]
+        if len(pairs) == 1:
+            self.nogoods.setdefault(pairs[0], []).append(None)
+        else:
+            first, second = pairs
+            self.nogoods.setdefault(first, []).append(second)
+            self.nogoods.setdefault(second, []).append(first)
 
+    def count_node(self):
+        """
+        Count one expanded search node and check the search limits.
+        """
+        self.nodes += 1
+        self.check_limits()
 
-def main():
+    def check_limits(self):
+        """
+        Raise SearchLimitReached if the node limit, the deadline or the stop
+        event says to give up.
+        """
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchLimitReached("node limit")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchLimitReached("time limit")
+        if self.stop is not None and self.stop.is_set():
+            raise SearchLimitReached("cancelled")
+
+    def inference(self, assignment, var):
+        """
+        Maintain arc consistency after `var` has been added to `assignment`.
+        The domain of `var` is reduced to its assigned value and arc
+        consistency is enforced on the arcs pointing at it. Any unassigned
+        variable left with a single value is added to `assignment`.
+
+        Return the list of inferred variables, or None if a domain was wiped
+        out or the inferred values are inconsistent. Domain removals are left
+        on the trail for the caller to undo.
+        """
+        value = assignment[var]
+        if len(self.domains[var]) > 1:
+            for other in list(self.domains[var]):
+                if other != value:
+                    self.remove_value(var, other)
+            self.explain(var, frozenset([var]))
+        arcs = [
+            (Y, var) for Y in self.crossword.neighbors(var)
+            if Y not in assignment
+        ]
+        if not self.ac3(arcs=arcs):
+            self.failure = set(self.explanations[self.wipeout])
+            return None
+        inferences = [
+            v for v in self.domains
+            if v not in assignment and len(self.domains[v]) == 1
+        ]
+        for k, v in enumerate(inferences):
+            inferred = next(iter(self.domains[v]))
+            culprits = self.conflicts(v, inferred, assignment)
+            if culprits is not None:
+                self.failure = culprits | self.explanations[v] | {var}
+                for u in inferences[:k]:
+                    self.unassign(u, assignment)
+                return None
+            self.reasons[v] = self.explanations[v] | {var}
+            self.assign(v, inferred, assignment)
+        return inferences
+
+    def conflicts(self, var, value, assignment):
+        """
+        Check whether `value` can be assigned to `var` given `assignment`.
+        Only the constraints involving `var` are checked: its length, that
+        `value` is not already used, its overlaps with assigned neighbors and
+        the learned nogoods. When enumerating diverse solutions, `value` is
+        also rejected if it would leave too few slots to differ from an
+        earlier solution.
+
+        Return None if `value` is consistent; otherwise return the set of
+        chosen variables responsible for rejecting it.
+        """
+        if len(value) != var.length:
+            return set()
+        owner = self.used_words.get(value)
+        if owner is not None:
+            return set(self.reasons[owner])
+        for neighbor, (i, j) in self.crossword.neighbor_overlaps[var]:
+            if neighbor in assignment and value[i] != assignment[neighbor][j]:
+                return set(self.reasons[neighbor])
+        for partner in self.nogoods.get((var, value), ()):
+            if partner is None:
+                return set()
+            other, other_value = partner
+            if assignment.get(other) == other_value:
+                return set(self.reasons[other])
+        if self.previous:
+            most = len(self.crossword.variables) - self.min_difference
+            for solution, agreement in zip(self.previous, self.agreements):
+                if agreement >= most and solution[var] == value:
+                    return set(self.choices)
+        return None
+
+    def too_similar(self):
+        """
+        Return True if the current assignment already shares too many slots
+        with an earlier solution for any extension of it to be diverse.
+        """
+        most = len(self.crossword.variables) - self.min_difference
+        return any(agreement > most for agreement in self.agreements)
+
+    def assign(self, var, value, assignment):
+        """
+        Add `var = value` to `assignment` and mark `value` as used.
+        """
+        assignment[var] = value
+        self.used_words[value] = var
+        for k, solution in enumerate(self.previous):
+            if solution[var] == value:
+                self.agreements[k] += 1
+
+    def unassign(self, var, assignment):
+        """
+        Remove `var` from `assignment` and release its word.
+        """
+        value = assignment.pop(var)
+        del self.used_words[value]
+        for k, solution in enumerate(self.previous):
+            if solution[var] == value:
+                self.agreements[k] -= 1
+
+    def remove_value(self, var, value):
+        """
+        Remove `value` from the domain of `var`, recording the removal on
+        the trail so it can be undone when the search backtracks.
+        """
+        domain = self.domains[var]
+        domain.remove(value)
+        self.trail.append((var, value))
+        entry = self.letter_count_cache.get(var)
+        if entry is not None and entry[0] is domain:
+            entry[1] -= 1
+            for letters, letter in zip(entry[2], value):
+                letters[letter] -= 1
+
+    def explain(self, var, reasons):
+        """
+        Add the chosen variables in `reasons` to the explanation for the
+        removals from the domain of `var`, recording the change on the trail.
+        """
+        old = self.explanations[var]
+        if reasons <= old:
+            return
+        self.trail.append((var, None, old))
+        self.explanations[var] = old | reasons
+
+    def undo(self, mark):
+        """
+        Restore every domain removal and explanation recorded on the trail
+        after position `mark`, most recent first.
+        """
+        trail = self.trail
+        domains = self.domains
+        cache = self.letter_count_cache
+        while len(trail) > mark:
+            entry = trail.pop()
+            if len(entry) == 3:
+                var, _, old = entry
+                self.explanations[var] = old
+                continue
+            var, value = entry
+            domain = domains[var]
+            domain.add(value)
+            entry = cache.get(var)
+            if entry is not None and entry[0] is domain:
+                entry[1] += 1
+                for letters, letter in zip(entry[2], value):
+                    letters[letter] += 1
+
+    def letter_counts(self, var):
+        """
+        Return a list with, for each position k in `var`, a dict mapping
+        each letter to the number of words in the domain of `var` with that
+        letter at position k.
 
-    # Check usage
-    if len(sys.argv) not in [3, 4]:
-        sys.exit("Usage: python generate.py structure words [output]")
+        The counts are cached and kept up to date by `remove_value` and
+        `undo`. They are rebuilt if the domain has been replaced or its size
+        no longer matches, e.g. after `enforce_node_consistency`.
+        """
+        domain = self.domains[var]
+        entry = self.letter_count_cache.get(var)
+        if entry is None or entry[0] is not domain or entry[1] != len(domain):
+            counts = [dict() for _ in range(var.length)]
+            for word in domain:
+                for letters, letter in zip(counts, word):
+                    letters[letter] = letters.get(letter, 0) + 1
+            entry = [domain, len(domain), counts]
+            self.letter_count_cache[var] = entry
+        return entry[2]
+
+
+def main():
 
     # Parse command-line arguments
-    structure = sys.argv[1]
-    words = sys.argv[2]
-    output = sys.argv[3] if len(sys.argv) == 4 else None
+    parser = argparse.ArgumentParser(
+        usage="python generate.py structure words [output] "
+              "[--solutions N] [--min-difference D]"
+    )
+    parser.add_argument("structure")
+    parser.add_argument("words")
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--solutions", type=int, default=1,
+                        help="number of solutions to write")
+    parser.add_argument("--min-difference", type=int, default=0,
+                        help="slots each solution must change")
+    args = parser.parse_args()
+    if args.solutions < 1:
+        sys.exit("--solutions must be at least 1")
 
     # Generate crossword
-    crossword = Crossword(structure, words)
+    crossword = Crossword(args.structure, args.words)
     creator = CrosswordCreator(crossword)
-    assignment = creator.solve()
+    if args.solutions == 1:
+        assignment = creator.solve()
 
-    # Print result
-    if assignment is None:
-        print("No solution.")
-    else:
+        # Print result
+        if assignment is None:
+            print("No solution.")
+        else:
+            creator.print(assignment)
+            if args.output:
+                creator.save(assignment, args.output)
+        return
+
+    # Stream solutions as they are found, rendering any images in a batch
+    start = time.perf_counter()
+    count = 0
+    jobs = []
+    for assignment in creator.solutions(args.min_difference):
+        count += 1
+        if count > 1:
+            print()
         creator.print(assignment)
-        if output:
-            creator.save(assignment, output)
+        sys.stdout.flush()
+        if args.output:
+            root, ext = os.path.splitext(args.output)
+            jobs.append(
+                (creator.letter_grid(assignment), f"{root}{count}{ext}")
+            )
+        if count == args.solutions:
+            break
+    elapsed = time.perf_counter() - start
+    if jobs:
+        render_batch(crossword.structure, jobs)
+
+    if count == 0:
+        print("No solution.")
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"{count} solutions in {elapsed:.3f}s ({rate:.1f} solutions/s)",
+          file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+import argparse
+import multiprocessing
+import queue
+import sys
+import time
+
+from crossword import Crossword
+from generate import CrosswordCreator, SearchLimitReached
+
+# Solver strategies, as (name, randomized tie-breaking, restart policy).
+# Workers are assigned strategies round-robin, each with its own seed.
+STRATEGIES = [
+    ("deterministic", False, None),
+    ("random-ties", True, None),
+    ("luby-restarts", True, "luby"),
+    ("geometric-restarts", True, "geometric"),
+]
+
+# Node budget of the first run under a restart policy
+NODE_LIMIT = 1000
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Fill a crossword by racing several solver processes."
+    )
+    parser.add_argument("structure")
+    parser.add_argument("words")
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--node-limit", type=int, default=NODE_LIMIT,
+                        help="node budget of the first restart")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="seconds each worker may search for")
+    args = parser.parse_args()
+    if args.workers < 1:
+        sys.exit("--workers must be at least 1")
+
+    winner, reports = solve_portfolio(
+        args.structure, args.words,
+        workers=args.workers,
+        seed=args.seed,
+        node_limit=args.node_limit,
+        time_limit=args.time_limit
+    )
+
+    # Print per-worker statistics
+    print(f"{'worker':>6}  {'strategy':<20}{'seed':>6}  {'status':<14}"
+          f"{'nodes':>10}{'restarts':>10}{'nodes/s':>12}")
+    for report in reports:
+        print(f"{report['worker']:>6}  {report['strategy']:<20}"
+              f"{report['seed']:>6}  {report['status']:<14}"
+              f"{report['nodes']:>10}{report['restarts']:>10}"
+              f"{report['nodes_per_second']:>12.0f}")
+    print()
+
+    # Print result
+    if winner is None:
+        print("No solution.")
+        return
+    print(f"Winner: worker {winner['worker']} ({winner['strategy']}, "
+          f"seed {winner['seed']}) in {winner['elapsed']:.3f}s")
+    creator = CrosswordCreator(Crossword(args.structure, args.words))
+    creator.print(winner["assignment"])
+    if args.output:
+        creator.save(winner["assignment"], args.output)
+
+
+def solve_portfolio(structure, words, workers, seed=0,
+                    node_limit=NODE_LIMIT, time_limit=None):
+    """
+    Search for a solution to the crossword in `structure` using `words` with
+    `workers` processes running different strategies. The first solution
+    found wins and the remaining workers are told to stop.
+
+    Return a tuple (winner, reports), where `reports` is a list with one
+    dict of statistics per worker and `winner` is the report of the worker
+    that found a solution, or None if none was found.
+    """
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = []
+    for worker in range(workers):
+        strategy = STRATEGIES[worker % len(STRATEGIES)]
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(worker, strategy, structure, words, seed + worker,
+                  node_limit, time_limit, stop, results)
+        )
+        process.start()
+        processes.append(process)
+
+    winner = None
+    reports = []
+    while len(reports) < workers:
+        try:
+            report = results.get(timeout=0.1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        reports.append(report)
+        if report["status"] == "solved" and winner is None:
+            winner = report
+            stop.set()
+        elif report["status"] == "unsatisfiable":
+            stop.set()
+
+    for process in processes:
+        process.join()
+    reports.sort(key=lambda report: report["worker"])
+    return winner, reports
+
+
+def run_worker(worker, strategy, structure, words, seed, node_limit,
+               time_limit, stop, results):
+    """
+    Search with one strategy until a solution is found, the problem is
+    shown to be unsatisfiable, the time limit passes or `stop` is set.
+    Put a dict of statistics for the run on the `results` queue.
+    """
+    name, randomized, policy = strategy
+    start = time.monotonic()
+    deadline = start + time_limit if time_limit is not None else None
+
+    # Node and arc consistency are shared by every restart
+    crossword = Crossword(structure, words)
+    base = CrosswordCreator(crossword)
+    base.enforce_node_consistency()
+    status = "unsatisfiable" if not base.ac3() else None
+
+    assignment = None
+    nodes = 0
+    restarts = 0
+    while status is None:
+        creator = CrosswordCreator(
+            crossword, seed=seed + restarts if randomized else None
+        )
+        creator.domains = {
+            var: domain.copy() for var, domain in base.domains.items()
+        }
+        creator.node_limit = restart_limit(policy, node_limit, restarts)
+        creator.deadline = deadline
+        creator.stop = stop
+        try:
+            assignment = creator.backtrack(dict())
+            status = "solved" if assignment is not None else "unsatisfiable"
+        except SearchLimitReached as limit:
+            if str(limit) != "node limit":
+                status = str(limit)
+            else:
+                restarts += 1
+        nodes += creator.nodes
+
+    elapsed = time.monotonic() - start
+    results.put({
+        "worker": worker,
+        "strategy": name,
+        "seed": seed,
+        "status": status,
+        "assignment": assignment,
+        "nodes": nodes,
+        "restarts": restarts,
+        "elapsed": elapsed,
+        "nodes_per_second": nodes / elapsed if elapsed > 0 else 0.0
+    })
+
+
+def restart_limit(policy, node_limit, restarts):
+    """
+    Return the node limit for run number `restarts` (counting from 0)
+    under restart `policy`, or None if the run is not limited.
+    """
+    if policy == "luby":
+        return node_limit * luby(restarts + 1)
+    if policy == "geometric":
+        return int(node_limit * 1.5 ** restarts)
+    return None
+
+
+def luby(i):
+    """
+    Return the `i`th term (counting from 1) of the Luby sequence
+    1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ...
+    """
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+if __name__ == "__main__":
+    main()
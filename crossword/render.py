@@ -0,0 +1,203 @@
+import functools
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+FONT = "assets/fonts/OpenSans-Regular.ttf"
+FONT_SIZE = 80
+CELL_SIZE = 100
+CELL_BORDER = 2
+
+# Output formats that are written as text rather than rendered with PIL
+TEXT_FORMATS = [".svg", ".txt"]
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(path=FONT, size=FONT_SIZE):
+    """Load a TrueType font, reading each (path, size) from disk only once."""
+    from PIL import ImageFont
+    return ImageFont.truetype(path, size)
+
+
+class Renderer():
+    """
+    Renders letter grids for one crossword structure. The blank grid and a
+    tile for each letter are drawn once; every grid after that is a copy of
+    the blank grid with letter tiles pasted onto it.
+    """
+
+    def __init__(self, structure, cell_size=CELL_SIZE,
+                 cell_border=CELL_BORDER, font=FONT, font_size=FONT_SIZE,
+                 mode="RGBA"):
+        """
+        Create a renderer for `structure`, a list of rows of booleans that
+        are True for cells to be filled in. Images are drawn in PIL `mode`;
+        "L" (grayscale) looks the same and is much cheaper to encode.
+        """
+        self.structure = structure
+        self.mode = mode
+        self.height = len(structure)
+        self.width = len(structure[0]) if structure else 0
+        self.cell_size = cell_size
+        self.cell_border = cell_border
+        self.font = font
+        self.font_size = font_size
+        self.background = None
+        self.tiles = dict()
+
+    def blank(self):
+        """Return the image of the empty grid, drawing it the first time."""
+        if self.background is None:
+            from PIL import Image, ImageDraw
+            self.background = Image.new(
+                self.mode,
+                (self.width * self.cell_size, self.height * self.cell_size),
+                "black"
+            )
+            draw = ImageDraw.Draw(self.background)
+            for i in range(self.height):
+                for j in range(self.width):
+                    if self.structure[i][j]:
+                        draw.rectangle(self.cell_rect(i, j), fill="white")
+        return self.background
+
+    def tile(self, letter):
+        """Return the image of a filled-in cell, drawing it the first time."""
+        if letter not in self.tiles:
+            from PIL import Image, ImageDraw
+            size = self.cell_size - 2 * self.cell_border
+            tile = Image.new(self.mode, (size + 1, size + 1), "white")
+            draw = ImageDraw.Draw(tile)
+            font = load_font(self.font, self.font_size)
+            _, _, w, h = draw.textbbox((0, 0), letter, font=font)
+            draw.text(
+                ((size - w) / 2, (size - h) / 2 - 10),
+                letter, fill="black", font=font
+            )
+            self.tiles[letter] = tile
+        return self.tiles[letter]
+
+    def cell_rect(self, i, j):
+        """Return the corners of the interior of cell (i, j)."""
+        return [
+            (j * self.cell_size + self.cell_border,
+             i * self.cell_size + self.cell_border),
+            ((j + 1) * self.cell_size - self.cell_border,
+             (i + 1) * self.cell_size - self.cell_border)
+        ]
+
+    def render(self, letters):
+        """
+        Return an image of the grid filled in with `letters`, a 2D array of
+        letters (or None) as returned by `CrosswordCreator.letter_grid`.
+        """
+        img = self.blank().copy()
+        for i in range(self.height):
+            for j in range(self.width):
+                if self.structure[i][j] and letters[i][j]:
+                    img.paste(self.tile(letters[i][j]), self.cell_rect(i, j)[0])
+        return img
+
+    def svg(self, letters):
+        """Return an SVG document of the grid filled in with `letters`."""
+        size = self.cell_size
+        interior = size - 2 * self.cell_border
+        width, height = self.width * size, self.height * size
+        lines = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+            f'height="{height}" viewBox="0 0 {width} {height}">',
+            f'<rect width="{width}" height="{height}" fill="black"/>',
+            f'<g font-family="Open Sans, sans-serif" '
+            f'font-size="{self.font_size}" text-anchor="middle">'
+        ]
+        for i in range(self.height):
+            for j in range(self.width):
+                if not self.structure[i][j]:
+                    continue
+                (x, y), _ = self.cell_rect(i, j)
+                lines.append(
+                    f'<rect x="{x}" y="{y}" width="{interior}" '
+                    f'height="{interior}" fill="white"/>'
+                )
+                if letters[i][j]:
+                    lines.append(
+                        f'<text x="{x + interior / 2:g}" '
+                        f'y="{y + interior / 2:g}" '
+                        f'dominant-baseline="central">{letters[i][j]}</text>'
+                    )
+        lines.append("</g>")
+        lines.append("</svg>")
+        return "\n".join(lines) + "\n"
+
+    def text(self, letters):
+        """Return the grid filled in with `letters` as it is printed."""
+        rows = []
+        for i in range(self.height):
+            rows.append("".join(
+                (letters[i][j] or " ") if self.structure[i][j] else "█"
+                for j in range(self.width)
+            ))
+        return "\n".join(rows) + "\n"
+
+    def save(self, letters, filename):
+        """
+        Save the grid filled in with `letters` to `filename`. Files ending in
+        .svg or .txt are written as text; anything else is rendered as an
+        image in the format PIL picks from the extension.
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == ".svg":
+            with open(filename, "w") as f:
+                f.write(self.svg(letters))
+        elif ext == ".txt":
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(self.text(letters))
+        else:
+            self.render(letters).save(filename)
+
+
+# Renderer of each worker process in `render_batch`
+worker_renderer = None
+
+
+def init_worker(structure, options):
+    """Create the renderer a `render_batch` worker process reuses."""
+    global worker_renderer
+    worker_renderer = Renderer(structure, **options)
+
+
+def render_job(job):
+    """Save one (letters, filename) job with the worker's renderer."""
+    letters, filename = job
+    worker_renderer.save(letters, filename)
+    return filename
+
+
+def render_batch(structure, jobs, workers=None, **options):
+    """
+    Save many filled-in grids for `structure`, where `jobs` is an iterable
+    of (letters, filename) pairs. Raster images are rendered concurrently by
+    `workers` processes, each loading the font and drawing tiles only once;
+    .svg and .txt files are cheap enough to write in this process.
+
+    Return the list of filenames written.
+    """
+    raster = []
+    written = []
+    renderer = Renderer(structure, **options)
+    for letters, filename in jobs:
+        if os.path.splitext(filename)[1].lower() in TEXT_FORMATS:
+            renderer.save(letters, filename)
+            written.append(filename)
+        else:
+            raster.append((letters, filename))
+    if raster:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(raster) // (4 * workers))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(structure, options)
+        ) as pool:
+            written.extend(pool.map(render_job, raster, chunksize=chunksize))
+    return written
@@ -0,0 +1,245 @@
+import mmap
+import struct
+import sys
+
+# Index files start with this magic string, followed by the bucket count
+MAGIC = b"CWINDEX1"
+
+# Character matching any letter in a pattern
+WILDCARD = "?"
+
+# Words are stored one byte per character
+ENCODING = "latin-1"
+
+HEADER = struct.Struct("<8sI")
+
+# For each bucket: word length, word count, offset of the words, offset of
+# the postings table
+BUCKET = struct.Struct("<IIQQ")
+
+# For each (position, letter byte) in a bucket: offset and length of the
+# sorted list of word ids with that letter at that position
+POSTING = struct.Struct("<QI")
+
+
+def main():
+
+    # Check usage
+    usage = (
+        "Usage: python wordindex.py build words index\n"
+        "       python wordindex.py match index pattern"
+    )
+    if len(sys.argv) != 4 or sys.argv[1] not in ["build", "match"]:
+        sys.exit(usage)
+
+    if sys.argv[1] == "build":
+        counts = build_index(sys.argv[2], sys.argv[3])
+        for length in sorted(counts):
+            print(f"{length:>3} letters: {counts[length]} words")
+        print(f"Index written to {sys.argv[3]}.")
+    else:
+        index = WordIndex(sys.argv[2])
+        for word in index.match(sys.argv[3]):
+            print(word)
+
+
+def build_index(words_file, index_file):
+    """
+    Read the vocabulary in `words_file`, one word per line, and write a
+    binary index of it to `index_file`. Words are uppercased, deduplicated
+    and bucketed by length, and each bucket stores the ids of the words
+    with each letter at each position. Words that cannot be stored one byte
+    per character are skipped and reported on stderr.
+
+    Return a dict mapping each word length to its number of words.
+    """
+    with open(words_file) as f:
+        words = set(f.read().upper().splitlines())
+    words.discard("")
+
+    buckets = dict()
+    skipped = []
+    for word in words:
+        try:
+            encoded = word.encode(ENCODING)
+        except UnicodeEncodeError:
+            skipped.append(word)
+            continue
+        buckets.setdefault(len(word), []).append(encoded)
+    if skipped:
+        examples = ", ".join(sorted(skipped)[:5])
+        print(f"Skipped {len(skipped)} words not encodable as {ENCODING}, "
+              f"e.g. {examples}", file=sys.stderr)
+    lengths = sorted(buckets)
+
+    # Lay out each bucket's words and postings after the bucket table
+    chunks = []
+    table = []
+    offset = HEADER.size + BUCKET.size * len(lengths)
+    for length in lengths:
+        words = sorted(buckets[length])
+        data = b"".join(words)
+        data += bytes(-len(data) % 4)
+        words_offset = offset
+        chunks.append(data)
+        offset += len(data)
+
+        postings = [[[] for _ in range(256)] for _ in range(length)]
+        for word_id, word in enumerate(words):
+            for k, letter in enumerate(word):
+                postings[k][letter].append(word_id)
+
+        postings_offset = offset
+        offset += POSTING.size * 256 * length
+        entries = []
+        lists = []
+        for position in postings:
+            for ids in position:
+                entries.append(POSTING.pack(offset, len(ids)))
+                data = struct.pack(f"<{len(ids)}I", *ids)
+                lists.append(data)
+                offset += len(data)
+        chunks.append(b"".join(entries))
+        chunks.extend(lists)
+        table.append(BUCKET.pack(length, len(words), words_offset,
+                                 postings_offset))
+
+    with open(index_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(lengths)))
+        f.write(b"".join(table))
+        for chunk in chunks:
+            f.write(chunk)
+
+    return {length: len(buckets[length]) for length in lengths}
+
+
+def is_index(filename):
+    """
+    Return True if `filename` is a word index written by `build_index`.
+    """
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class WordIndex():
+    """
+    Read-only, memory-mapped view of a word index. Behaves like a set of
+    words, and answers wildcard pattern queries using its postings.
+    """
+
+    def __init__(self, filename):
+        """
+        Memory-map the index in `filename`. Words are only decoded when a
+        bucket is first asked for.
+        """
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a word index")
+
+        # Map from word length to (count, words offset, postings offset)
+        self.buckets = dict()
+        for b in range(count):
+            length, n, words_offset, postings_offset = BUCKET.unpack_from(
+                self.map, HEADER.size + b * BUCKET.size
+            )
+            self.buckets[length] = (n, words_offset, postings_offset)
+        self.cache = dict()
+
+    def __contains__(self, word):
+        return word in self.words(len(word))
+
+    def __iter__(self):
+        for length in self.lengths():
+            yield from self.words(length)
+
+    def __len__(self):
+        return sum(n for n, _, _ in self.buckets.values())
+
+    def lengths(self):
+        """Return a sorted list of the word lengths in the index."""
+        return sorted(self.buckets)
+
+    def words(self, length):
+        """Return a frozenset of all words with `length` letters."""
+        if length not in self.cache:
+            if length not in self.buckets:
+                self.cache[length] = frozenset()
+            else:
+                n, offset, _ = self.buckets[length]
+                data = self.map[offset:offset + n * length].decode(ENCODING)
+                self.cache[length] = frozenset(
+                    data[k:k + length] for k in range(0, len(data), length)
+                )
+        return self.cache[length]
+
+    def word(self, length, word_id):
+        """Return the word with id `word_id` among words of `length`."""
+        _, offset, _ = self.buckets[length]
+        start = offset + word_id * length
+        return self.map[start:start + length].decode(ENCODING)
+
+    def postings(self, length, position, letter):
+        """
+        Return a memoryview of the sorted ids of words of `length` letters
+        with `letter` at `position`.
+        """
+        _, _, table = self.buckets[length]
+        byte = letter.encode(ENCODING)[0]
+        offset, count = POSTING.unpack_from(
+            self.map, table + POSTING.size * (256 * position + byte)
+        )
+        return self.view[offset:offset + 4 * count].cast("I")
+
+    def match(self, pattern):
+        """
+        Return a list, in sorted order, of the words matching `pattern`,
+        where WILDCARD matches any letter, e.g. "C?T??".
+        """
+        pattern = pattern.upper()
+        length = len(pattern)
+        if length not in self.buckets:
+            return []
+        try:
+            pattern.encode(ENCODING)
+        except UnicodeEncodeError:
+            # No word in the index has such a letter
+            return []
+        fixed = [
+            (k, letter) for k, letter in enumerate(pattern)
+            if letter != WILDCARD
+        ]
+        if not fixed:
+            return sorted(self.words(length))
+
+        # Walk the shortest postings list, checking the other letters
+        # directly against the stored words
+        n, offset, _ = self.buckets[length]
+        postings = [
+            (self.postings(length, k, letter), k, letter)
+            for k, letter in fixed
+        ]
+        postings.sort(key=lambda p: len(p[0]))
+        ids, _, _ = postings[0]
+        checks = [
+            (k, letter.encode(ENCODING)[0]) for _, k, letter in postings[1:]
+        ]
+        data = self.map
+        matches = []
+        for word_id in ids:
+            start = offset + word_id * length
+            if all(data[start + k] == byte for k, byte in checks):
+                matches.append(self.word(length, word_id))
+        return matches
+
+    def close(self):
+        """Release the memory map."""
+        self.cache.clear()
+        self.view.release()
+        self.map.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import random
+import sys
+import time
+
+import nltk
+
+from cyk import CYKParser
+from parser import grammar, preprocess
+
+# Phrases appended to a sentence to lengthen it, each keeping it parsable
+PHRASES = [
+    "in the red armchair", "on thursday", "before the little door",
+    "and chuckled", "and lit his pipe", "and never smiled", "the day"
+]
+
+# Synthetic sentence lengths, in words
+LENGTHS = [10, 20, 40, 80, 160]
+
+# Sentences whose trees outnumber this are only counted, not enumerated
+MAX_TREES = 10_000
+
+# Times each bundled sentence is parsed
+REPEATS = 20
+
+
+def main():
+
+    # Check command-line arguments
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python benchmark.py sentences_directory")
+
+    engines = {
+        "chart": nltk.ChartParser(grammar),
+        "cyk": CYKParser(grammar)
+    }
+
+    sentences = []
+    for filename in sorted(os.listdir(sys.argv[1])):
+        with open(os.path.join(sys.argv[1], filename)) as f:
+            sentences.append(preprocess(f.read()))
+
+    print(f"Bundled sentences, all trees, {REPEATS} times each")
+    print(f"{'engine':<8}{'seconds':>10}{'sentences/s':>13}{'same set':>12}")
+    reference = None
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            parses = [list(engine.parse(words)) for words in sentences]
+        elapsed = time.perf_counter() - start
+        # Engines yield trees in different orders, so compare them as sets
+        trees = [sorted(map(str, trees)) for trees in parses]
+        if reference is None:
+            reference = trees
+        print(f"{name:<8}{elapsed:>10.3f}"
+              f"{REPEATS * len(sentences) / elapsed:>13.0f}"
+              f"{'yes' if trees == reference else 'NO':>12}")
+    print()
+
+    print("Synthetic sentences")
+    print(f"{'words':>6}{'trees':>10}{'chart build s':>15}{'cyk build s':>13}"
+          f"{'chart all s':>13}{'cyk all s':>11}{'same set':>12}")
+    rng = random.Random(0)
+    for length in LENGTHS:
+        words = synthetic(length, rng)
+
+        count = engines["cyk"].count(words)
+
+        # Time filling each chart, then enumerating every tree if feasible
+        start = time.perf_counter()
+        engines["chart"].chart_parse(words)
+        chart_build = time.perf_counter() - start
+        start = time.perf_counter()
+        engines["cyk"].chart(words)
+        cyk_build = time.perf_counter() - start
+
+        times = {}
+        trees = {}
+        for name, engine in engines.items():
+            if count > MAX_TREES:
+                break
+            start = time.perf_counter()
+            parses = list(engine.parse(words))
+            times[name] = time.perf_counter() - start
+            trees[name] = sorted(map(str, parses))
+        same = trees["chart"] == trees["cyk"] if trees else None
+        print(f"{len(words):>6}{count:>10}{chart_build:>15.4f}"
+              f"{cyk_build:>13.4f}"
+              f"{format_time(times.get('chart')):>13}"
+              f"{format_time(times.get('cyk')):>11}"
+              f"{'-' if same is None else 'yes' if same else 'NO':>12}")
+
+
+def synthetic(length, rng):
+    """
+    Return a parsable list of about `length` words, made by extending a
+    simple sentence with randomly chosen PHRASES.
+    """
+    words = ["holmes", "sat"]
+    while len(words) < length:
+        words.extend(rng.choice(PHRASES).split())
+    return words
+
+
+def format_time(seconds):
+    """Format a duration in seconds, or - if it was not measured."""
+    return "-" if seconds is None else f"{seconds:.4f}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import nltk
+
+from nltk.grammar import Nonterminal
+
+
+class CYKParser():
+    """
+    Parses with a CYK chart over a compiled, binarized form of an nltk CFG,
+    producing the same set of trees as nltk's chart parsers. The trees are
+    not yielded in the same order as nltk's, which depends on its agenda.
+
+    When compiled, every symbol gets an integer id. Rules with more than two
+    symbols on the right are split into chains of binary rules through
+    artificial symbols, and unit rules (A -> B) are closed over, so that
+    each symbol knows every chain of unit rules leading up from it. Trees
+    are rebuilt from the chart with the artificial symbols spliced out and
+    the unit chains restored, so they match the original grammar.
+
+    Supports grammars whose rules either rewrite a symbol as a single
+    terminal or as one or more nonterminals, and whose unit rules have no
+    cycles.
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.names = []
+        self.ids = {}
+        self.artificial = set()
+
+        # Symbols that can rewrite as each word
+        self.lexicon = {}
+
+        # For each left child, its possible right children as a bitset,
+        # and the parents of each (left, right) pair
+        self.right_masks = {}
+        self.parents = {}
+
+        # For each symbol, the chains of unit rules above it
+        self.chains = {}
+
+        self.compile()
+
+    def symbol(self, name):
+        """Return the integer id of the symbol `name`, adding it if new."""
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def compile(self):
+        """Build the integer-id rule tables from the grammar's productions."""
+        units = {}
+        for production in self.grammar.productions():
+            lhs = self.symbol(production.lhs().symbol())
+            rhs = production.rhs()
+            if len(rhs) == 1 and not isinstance(rhs[0], Nonterminal):
+                self.lexicon.setdefault(rhs[0], []).append(lhs)
+                continue
+            if not all(isinstance(item, Nonterminal) for item in rhs):
+                raise ValueError(f"Unsupported production: {production}")
+            rhs = [self.symbol(item.symbol()) for item in rhs]
+            if len(rhs) == 1:
+                units.setdefault(rhs[0], []).append(lhs)
+                continue
+
+            # Binarize A -> X1 X2 ... Xn as A -> X1 @1, @1 -> X2 @2, ...
+            parent = lhs
+            for k in range(len(rhs) - 2):
+                child = self.symbol((production, k))
+                self.artificial.add(child)
+                self.add_binary(parent, rhs[k], child)
+                parent = child
+            self.add_binary(parent, rhs[-2], rhs[-1])
+
+        # Close over unit rules: each chain runs from an ancestor down to
+        # the symbol, as a tuple of symbol ids
+        def climb(chain):
+            for parent in units.get(chain[0], []):
+                if parent in chain:
+                    raise ValueError("Unsupported cycle of unit productions")
+                yield (parent,) + chain
+                yield from climb((parent,) + chain)
+        for symbol in range(len(self.names)):
+            self.chains[symbol] = list(climb((symbol,)))
+
+    def add_binary(self, parent, left, right):
+        """Add the binary rule `parent` -> `left` `right`."""
+        self.right_masks[left] = self.right_masks.get(left, 0) | 1 << right
+        self.parents.setdefault((left, right), []).append(parent)
+
+    def chart(self, words):
+        """
+        Fill and return the CYK chart for `words`. Cell `i * (n + 1) + j`
+        maps each symbol spanning words i to j to its back-pointers: the
+        word itself, a split point with left and right symbols, or a chain
+        of unit rules down to a symbol derived in another way. A parallel
+        array keeps the symbols of each cell as a bitset.
+        """
+        n = len(words)
+        cells = [None] * ((n + 1) * (n + 1))
+        masks = [0] * ((n + 1) * (n + 1))
+
+        # Bitsets of where non-empty spans starting at each i end, and where
+        # those ending at each j start, so only useful split points are tried
+        ends = [0] * (n + 1)
+        starts = [0] * (n + 1)
+
+        for i, word in enumerate(words):
+            cell = {}
+            for symbol in self.lexicon.get(word, []):
+                cell.setdefault(symbol, []).append(("word", word))
+            self.store(cells, masks, ends, starts, n, i, i + 1, cell)
+
+        for length in range(2, n + 1):
+            for i in range(n - length + 1):
+                j = i + length
+                cell = {}
+                splits = ends[i] & starts[j]
+                while splits:
+                    k = (splits & -splits).bit_length() - 1
+                    splits &= splits - 1
+                    right_mask = masks[k * (n + 1) + j]
+                    for b in cells[i * (n + 1) + k]:
+                        matches = self.right_masks.get(b, 0) & right_mask
+                        while matches:
+                            c = (matches & -matches).bit_length() - 1
+                            matches &= matches - 1
+                            for a in self.parents[(b, c)]:
+                                cell.setdefault(a, []).append(
+                                    ("split", k, b, c)
+                                )
+                self.store(cells, masks, ends, starts, n, i, j, cell)
+        return cells
+
+    def store(self, cells, masks, ends, starts, n, i, j, cell):
+        """Close `cell` over unit rules and record it as spanning i to j."""
+        self.close(cell)
+        cells[i * (n + 1) + j] = cell
+        if cell:
+            masks[i * (n + 1) + j] = mask_of(cell)
+            ends[i] |= 1 << j
+            starts[j] |= 1 << i
+
+    def close(self, cell):
+        """Add every unit chain above the symbols derived directly in `cell`."""
+        for symbol in list(cell):
+            for chain in self.chains[symbol]:
+                cell.setdefault(chain[0], []).append(("unit", chain))
+
+    def parse(self, words):
+        """
+        Yield every parse tree of the list of `words` whose root is the
+        grammar's start symbol, as nltk Trees, in chart order rather than
+        nltk's.
+        """
+        words = list(words)
+        self.grammar.check_coverage(words)
+        if not words:
+            return
+        cells = self.chart(words)
+        n = len(words)
+        start = self.ids.get(self.grammar.start().symbol())
+        if start in cells[n]:
+            yield from self.trees(cells, n, start, 0, n, {})
+
+    def trees(self, cells, n, symbol, i, j, memo, direct=False):
+        """
+        Return the list of trees for `symbol` spanning words i to j. For an
+        artificial symbol, each "tree" is the list of children it stands for.
+        If `direct` is True, unit chains ending at `symbol` are left out.
+        """
+        key = (symbol, i, j, direct)
+        if key in memo:
+            return memo[key]
+        name = self.names[symbol]
+        results = []
+        for pointer in cells[i * (n + 1) + j][symbol]:
+            if pointer[0] == "word":
+                results.append(nltk.Tree(name, [pointer[1]]))
+            elif pointer[0] == "split":
+                _, k, b, c = pointer
+                lefts = self.trees(cells, n, b, i, k, memo)
+                rights = self.trees(cells, n, c, k, j, memo)
+                for left in lefts:
+                    for right in rights:
+                        children = [left] + (
+                            right if c in self.artificial else [right]
+                        )
+                        results.append(
+                            children if symbol in self.artificial
+                            else nltk.Tree(name, children)
+                        )
+            elif not direct:
+                chain = pointer[1]
+                for tree in self.trees(
+                    cells, n, chain[-1], i, j, memo, direct=True
+                ):
+                    for ancestor in reversed(chain[:-1]):
+                        tree = nltk.Tree(self.names[ancestor], [tree])
+                    results.append(tree)
+        memo[key] = results
+        return results
+
+    def count(self, words):
+        """
+        Return the number of parse trees of `words`, without building them.
+        """
+        words = list(words)
+        self.grammar.check_coverage(words)
+        if not words:
+            return 0
+        cells = self.chart(words)
+        n = len(words)
+        start = self.ids.get(self.grammar.start().symbol())
+        if start not in cells[n]:
+            return 0
+        memo = {}
+
+        def count(symbol, i, j, direct=False):
+            key = (symbol, i, j, direct)
+            if key not in memo:
+                total = 0
+                for pointer in cells[i * (n + 1) + j][symbol]:
+                    if pointer[0] == "word":
+                        total += 1
+                    elif pointer[0] == "split":
+                        _, k, b, c = pointer
+                        total += count(b, i, k) * count(c, k, j)
+                    elif not direct:
+                        total += count(pointer[1][-1], i, j, direct=True)
+                memo[key] = total
+            return memo[key]
+        return count(start, 0, n)
+
+
+def mask_of(cell):
+    """Return the symbols of `cell` as a bitset."""
+    mask = 0
+    for symbol in cell:
+        mask |= 1 << symbol
+    return mask
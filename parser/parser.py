@@ -1,7 +1,26 @@
+import argparse
+import io
 import nltk
+import os
+import queue
 import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from nltk.tokenize import word_tokenize
 
+from cyk import CYKParser
+
+# Word sequences whose parse reports each process remembers
+CACHE_SIZE = 4096
+
+# Sentences sent to a worker process at a time, and the longest a sentence
+# waits for its batch to fill
+BATCH_SIZE = 32
+MAX_WAIT = 0.01
+
 TERMINALS = """
 Adj -> "country" | "dreadful" | "enigmatical" | "little" | "moist" | "red"
 Adv -> "down" | "here" | "never"
@@ -26,38 +45,247 @@ VP -> V | V NP | VP Adv | Adv VP
 grammar = nltk.CFG.fromstring(NONTERMINALS + TERMINALS)
 parser = nltk.ChartParser(grammar)
 
+# Parsers that can be chosen with --engine
+ENGINES = {"chart": nltk.ChartParser, "cyk": CYKParser}
+
 
 def main():
 
+    arguments = argparse.ArgumentParser(
+        usage="python parser.py [sentence_file] [--engine ENGINE] | "
+              "python parser.py --batch PATH [PATH ...] [--workers N] "
+              "[--engine ENGINE]"
+    )
+    arguments.add_argument("sentence_file", nargs="?", default=None)
+    arguments.add_argument("--batch", nargs="+", metavar="PATH",
+                           help="parse every sentence in these files or "
+                                "directories of files; - reads one "
+                                "sentence per line from stdin")
+    arguments.add_argument("--workers", type=int, default=os.cpu_count())
+    arguments.add_argument("--max-wait", type=float, default=MAX_WAIT,
+                           help="seconds a sentence read in a batch may wait "
+                                "for its batch to fill")
+    arguments.add_argument("--engine", choices=list(ENGINES), default="chart",
+                           help="nltk's chart parser, or a CYK parser over "
+                                "the grammar in binarized form; both find "
+                                "the same trees, but may print them in a "
+                                "different order")
+    args = arguments.parse_args()
+
+    if args.batch:
+        parse_all(sentence_stream(args.batch), args.workers, args.engine,
+                  args.max_wait)
+        return
+    use_engine(args.engine)
+
     # If filename specified, read sentence from file
-    if len(sys.argv) == 2:
-        with open(sys.argv[1]) as f:
+    if args.sentence_file:
+        with open(args.sentence_file) as f:
             s = f.read()
 
     # Otherwise, get sentence as input
     else:
         s = input("Sentence: ")
 
-    # Convert input into list of words
+    # Convert input into list of words, then parse and print each tree
+    # with noun phrase chunks
     s = preprocess(s)
-    
-    # Attempt to parse sentence
+    print(parse_report(tuple(s)), end="")
+
+
+def use_engine(engine):
+    """Parse with the parser of the given name from ENGINES from now on."""
+    global parser
+    if not isinstance(parser, ENGINES[engine]):
+        parser = ENGINES[engine](grammar)
+        parse_report.cache_clear()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_report(words):
+    """
+    Parse the tuple of preprocessed `words` and return the text printed for
+    it: each tree followed by its noun phrase chunks, or why it could not be
+    parsed. Reports are remembered for the CACHE_SIZE most recently seen
+    word sequences.
+    """
     try:
-        trees = list(parser.parse(s))
+        trees = list(parser.parse(words))
     except ValueError as e:
-        print(e)
-        return
+        return f"{e}\n"
     if not trees:
-        print("Could not parse sentence.")
-        return
+        return "Could not parse sentence.\n"
 
-    # Print each tree with noun phrase chunks
+    report = io.StringIO()
     for tree in trees:
-        tree.pretty_print()
+        tree.pretty_print(stream=report)
 
-        print("Noun Phrase Chunks")
+        print("Noun Phrase Chunks", file=report)
         for np in np_chunk(tree):
-            print(" ".join(np.flatten()))
+            print(" ".join(np.flatten()), file=report)
+    return report.getvalue()
+
+
+def parse_batch(sentences):
+    """
+    Return a list of (report, cached) pairs for a list of tuples of
+    preprocessed words, where `cached` says whether the report was already
+    known to this process.
+    """
+    results = []
+    for words in sentences:
+        hits = parse_report.cache_info().hits
+        report = parse_report(words)
+        results.append((report, parse_report.cache_info().hits > hits))
+    return results
+
+
+def parse_all(sentences, workers, engine="chart", max_wait=MAX_WAIT):
+    """
+    Parse an iterable of (name, sentence) pairs with a pool of `workers`
+    processes, each with its own `engine` parser, and print each sentence's
+    report in order as soon as it is ready. A partial batch is parsed once
+    its first sentence has waited `max_wait` seconds, so sentences read
+    from a stream are parsed as they arrive.
+
+    Reports of the CACHE_SIZE most recently seen word sequences are kept
+    here, so a repeated sentence is not sent to a worker at all.
+    """
+    start = time.perf_counter()
+    count = 0
+    hits = 0
+    cache = OrderedDict()
+    pending = deque()
+    tokenized = ((name, tuple(preprocess(text))) for name, text in sentences)
+    with ProcessPoolExecutor(
+        workers, initializer=use_engine, initargs=(engine,)
+    ) as pool:
+        for batch in sentence_batches(tokenized, BATCH_SIZE, max_wait):
+            if batch:
+
+                # Send each unknown word sequence to the pool once
+                known = {}
+                unknown = []
+                for _, words in batch:
+                    if words in cache:
+                        known[words] = cache[words]
+                    elif words not in unknown:
+                        unknown.append(words)
+                future = pool.submit(parse_batch, unknown) if unknown else None
+                pending.append((batch, known, unknown, future))
+
+            # Print batches in order once parsed, waiting on the oldest only
+            # when a couple of batches per worker are already in flight
+            while pending and (
+                pending[0][3] is None or pending[0][3].done()
+                or len(pending) > 2 * workers
+            ):
+                batch = pending[0][0]
+                hits += print_batch(*pending.popleft(), cache)
+                count += len(batch)
+        while pending:
+            batch = pending[0][0]
+            hits += print_batch(*pending.popleft(), cache)
+            count += len(batch)
+
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {count} sentences in {elapsed:.2f}s "
+          f"({count / elapsed:.0f} sentences/s), {hits} from cache",
+          file=sys.stderr)
+
+
+def print_batch(batch, known, unknown, future, cache):
+    """
+    Print the report of each (name, words) pair in `batch`, given the
+    reports `known` when it was submitted and the `future` parsing the
+    `unknown` word sequences, and remember them in the LRU `cache`. Return
+    how many sentences were not parsed for this batch.
+    """
+    parsed = set()
+    if future is not None:
+        for words, (report, cached) in zip(unknown, future.result()):
+            known[words] = report
+            if not cached:
+                parsed.add(words)
+    hits = 0
+    for name, words in batch:
+        print(f"== {name}")
+        print(known[words], end="", flush=True)
+        hits += words not in parsed
+        parsed.discard(words)
+        cache[words] = known[words]
+        cache.move_to_end(words)
+        if len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+    return hits
+
+
+def sentence_batches(sentences, batch_size, max_wait):
+    """
+    Yield lists of up to `batch_size` items of the iterable `sentences`,
+    which is read by a background thread. A partial list is yielded once
+    its first item has waited `max_wait` seconds, and an empty list every
+    `max_wait` seconds while no input arrives, so the caller can print
+    results in the meantime.
+    """
+    end = object()
+    arrivals = queue.Queue(2 * batch_size)
+    errors = []
+
+    def read():
+        try:
+            for sentence in sentences:
+                arrivals.put(sentence)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            arrivals.put(end)
+
+    threading.Thread(target=read, daemon=True).start()
+    batch = []
+    deadline = None
+    while True:
+        timeout = max_wait
+        if batch:
+            timeout = max(0.0, deadline - time.perf_counter())
+        try:
+            sentence = arrivals.get(timeout=timeout)
+        except queue.Empty:
+            yield batch
+            batch = []
+            continue
+        if sentence is end:
+            break
+        batch.append(sentence)
+        if len(batch) == 1:
+            deadline = time.perf_counter() + max_wait
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    if errors:
+        raise errors[0]
+
+
+def sentence_stream(paths):
+    """
+    Yield (name, sentence) pairs for each path in `paths`: a file holds one
+    sentence, a directory holds one sentence per file, and - means one
+    sentence per line of stdin.
+    """
+    for path in paths:
+        if path == "-":
+            for number, line in enumerate(sys.stdin, 1):
+                if line.strip():
+                    yield f"stdin:{number}", line
+        elif os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                with open(os.path.join(path, filename)) as f:
+                    yield os.path.join(path, filename), f.read()
+        else:
+            with open(path) as f:
+                yield path, f.read()
 
 def alpha_count(word):
     return sum(1 if ch.isalpha() else 0 for ch in word)
@@ -0,0 +1,79 @@
+import sys
+import time
+
+import numpy as np
+
+from sklearn.model_selection import train_test_split
+
+from shopping import BACKENDS, TEST_SIZE, evaluate, load_data, train_model
+
+# Rows queried one at a time to measure single-query latency
+LATENCY_QUERIES = 200
+
+
+def main():
+
+    # Check command-line arguments
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python benchmark.py data [copies]")
+    copies = int(sys.argv[2]) if len(sys.argv) == 3 else 1
+
+    # Enlarge the split data, so test rows never have copies in training
+    evidence, labels = load_data(sys.argv[1])
+    X_train, X_test, y_train, y_test = train_test_split(
+        evidence, labels, test_size=TEST_SIZE, random_state=0
+    )
+    if copies > 1:
+        X_train, y_train = enlarge(X_train, y_train, copies)
+        X_test, y_test = enlarge(X_test, y_test, copies)
+    print(f"Training rows: {len(X_train)}, test rows: {len(X_test)}")
+    print()
+
+    print(f"{'backend':<11}{'fit s':>8}{'predict s':>11}{'us/row':>9}"
+          f"{'us/query':>10}{'accuracy':>10}{'TPR':>8}{'TNR':>8}"
+          f"{'agrees':>8}")
+    reference = None
+    for backend in BACKENDS:
+        start = time.perf_counter()
+        model = train_model(X_train, y_train, backend)
+        fit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predictions = np.asarray(model.predict(X_test))
+        predict_time = time.perf_counter() - start
+
+        sample = X_test.iloc[:LATENCY_QUERIES]
+        start = time.perf_counter()
+        for k in range(len(sample)):
+            model.predict(sample.iloc[k:k + 1])
+        latency = (time.perf_counter() - start) / len(sample)
+
+        if reference is None:
+            reference = predictions
+        sensitivity, specificity = evaluate(y_test, predictions)
+        accuracy = (np.asarray(y_test) == predictions).mean()
+        agreement = (reference == predictions).mean()
+        print(f"{backend:<11}{fit_time:>8.3f}{predict_time:>11.3f}"
+              f"{1e6 * predict_time / len(X_test):>9.1f}"
+              f"{1e6 * latency:>10.0f}{100 * accuracy:>9.2f}%"
+              f"{100 * sensitivity:>7.2f}%{100 * specificity:>7.2f}%"
+              f"{100 * agreement:>7.2f}%")
+
+
+def enlarge(evidence, labels, copies):
+    """
+    Return `copies` copies of the data stacked together, with the
+    continuous columns jittered so that rows are not exact duplicates.
+    """
+    rng = np.random.default_rng(0)
+    evidence = evidence.loc[evidence.index.repeat(copies)].reset_index(drop=True)
+    labels = labels.loc[labels.index.repeat(copies)].reset_index(drop=True)
+    for column in evidence.columns:
+        if evidence[column].dtype.kind == "f":
+            noise = rng.normal(1, 0.01, len(evidence)).astype(np.float32)
+            evidence[column] = evidence[column] * noise
+    return evidence, labels
+
+
+if __name__ == "__main__":
+    main()
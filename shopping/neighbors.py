@@ -0,0 +1,263 @@
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sklearn.base import BaseEstimator, ClassifierMixin
+
+# Query rows handled together in one distance computation
+BLOCK_SIZE = 1024
+
+# Training rows compared with a block of queries at once; a block's
+# distances take BLOCK_SIZE * TRAIN_BLOCK_SIZE * 4 bytes (64 MB) per thread
+TRAIN_BLOCK_SIZE = 16384
+
+# Most candidate rows an LSH query block gathers at once
+CANDIDATE_LIMIT = 1 << 20
+
+
+class NearestNeighbors(ClassifierMixin, BaseEstimator):
+    """
+    Base class for the k-nearest-neighbor classifiers in this module. Rows
+    are stored as float32, and queries are answered in blocks of rows that
+    are spread over `n_jobs` threads; NumPy releases the GIL while it works.
+    """
+
+    def __init__(self, n_neighbors=1, block_size=BLOCK_SIZE, n_jobs=None):
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+
+    def fit(self, evidence, labels):
+        """Store the training rows and their labels. Return self."""
+        self.evidence_ = np.ascontiguousarray(evidence, dtype=np.float32)
+        self.classes_, self.encoded_ = np.unique(
+            np.asarray(labels), return_inverse=True
+        )
+        self.index()
+        return self
+
+    def index(self):
+        """Build any search structure needed over `self.evidence_`."""
+
+    def kneighbors_block(self, queries):
+        """
+        Return an array with the indices of the `n_neighbors` nearest
+        training rows to each row of `queries`, nearest first.
+        """
+        raise NotImplementedError
+
+    def kneighbors(self, evidence):
+        """Return the nearest-neighbor indices for every row of `evidence`."""
+        queries = np.ascontiguousarray(evidence, dtype=np.float32)
+        blocks = [
+            queries[start:start + self.block_size]
+            for start in range(0, len(queries), self.block_size)
+        ]
+        if not blocks:
+            return np.empty((0, self.n_neighbors), dtype=np.intp)
+        workers = self.n_jobs or os.cpu_count() or 1
+        if workers == 1 or len(blocks) == 1:
+            results = [self.kneighbors_block(block) for block in blocks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self.kneighbors_block, blocks))
+        return np.concatenate(results)
+
+    def predict(self, evidence):
+        """
+        Return the most common label among the nearest neighbors of each
+        row of `evidence`, breaking ties in favor of the smallest label.
+        """
+        neighbors = self.encoded_[self.kneighbors(evidence)]
+        return self.classes_[vote(neighbors, len(self.classes_))]
+
+
+def vote(neighbors, n_classes):
+    """
+    Given an array with the encoded labels (0 to `n_classes` - 1) of each
+    row's neighbors, return the most common label in each row, breaking
+    ties in favor of the smallest label.
+    """
+    if neighbors.shape[1] == 1:
+        return neighbors[:, 0]
+    votes = np.zeros((len(neighbors), n_classes), dtype=np.int32)
+    for c in range(n_classes):
+        votes[:, c] = (neighbors == c).sum(axis=1)
+    return votes.argmax(axis=1)
+
+
+def nearest(distances, k):
+    """
+    Return the column indices of the `k` smallest values in each row of
+    `distances`, in increasing order of distance.
+    """
+    k = min(k, distances.shape[1])
+    if k == 1:
+        return distances.argmin(axis=1)[:, None]
+    part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, part, axis=1).argsort(axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def brute_force(queries, evidence, norms, k, train_block_size):
+    """
+    Return the indices of the `k` rows of `evidence` nearest to each row of
+    `queries`, nearest first, given the squared norm of each row of
+    `evidence` in `norms`. Training rows are compared `train_block_size` at
+    a time, keeping a running top `k`, so memory does not grow with the
+    number of training rows.
+    """
+    query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+    best_distances = best_indices = None
+    for start in range(0, len(evidence), train_block_size):
+        stop = start + train_block_size
+        distances = queries @ evidence[start:stop].T
+        distances *= -2
+        distances += norms[start:stop]
+        distances += query_norms
+        columns = nearest(distances, k)
+        distances = np.take_along_axis(distances, columns, axis=1)
+        indices = columns + start
+        if best_indices is not None:
+            # Earlier rows come first, so they win ties as in one pass
+            distances = np.concatenate([best_distances, distances], axis=1)
+            indices = np.concatenate([best_indices, indices], axis=1)
+            columns = nearest(distances, k)
+            distances = np.take_along_axis(distances, columns, axis=1)
+            indices = np.take_along_axis(indices, columns, axis=1)
+        best_distances, best_indices = distances, indices
+    return best_indices
+
+
+class BlockedBruteForce(NearestNeighbors):
+    """
+    Exact nearest neighbors by brute force. Squared distances between a
+    block of queries and a block of `train_block_size` training rows are
+    computed at once as |q|^2 - 2 q.x + |x|^2, so the work is one float32
+    matrix product per pair of blocks.
+    """
+
+    def __init__(self, n_neighbors=1, block_size=BLOCK_SIZE,
+                 train_block_size=TRAIN_BLOCK_SIZE, n_jobs=None):
+        super().__init__(n_neighbors, block_size, n_jobs)
+        self.train_block_size = train_block_size
+
+    def index(self):
+        self.norms_ = np.einsum("ij,ij->i", self.evidence_, self.evidence_)
+
+    def kneighbors_block(self, queries):
+        return brute_force(queries, self.evidence_, self.norms_,
+                           self.n_neighbors, self.train_block_size)
+
+
+class RandomProjectionLSH(NearestNeighbors):
+    """
+    Approximate nearest neighbors by random-projection locality-sensitive
+    hashing. Each of `n_tables` tables hashes a row to the signs of its
+    projections onto `n_bits` random directions. A query is compared only
+    with the training rows sharing a bucket with it in some table, falling
+    back to brute force if there are too few.
+    """
+
+    def __init__(self, n_neighbors=1, n_tables=8, n_bits=12, random_state=0,
+                 block_size=BLOCK_SIZE, n_jobs=None):
+        super().__init__(n_neighbors, block_size, n_jobs)
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.random_state = random_state
+
+    def index(self):
+        rng = np.random.default_rng(self.random_state)
+        self.center_ = self.evidence_.mean(axis=0)
+        self.planes_ = rng.standard_normal(
+            (self.n_tables, self.evidence_.shape[1], self.n_bits)
+        ).astype(np.float32)
+        self.weights_ = 1 << np.arange(self.n_bits, dtype=np.int64)
+
+        # For each table, training rows sorted by hash code, so a bucket is
+        # a contiguous range found by binary search
+        codes = self.hash(self.evidence_)
+        self.order_ = np.argsort(codes, axis=1, kind="stable")
+        self.sorted_codes_ = np.take_along_axis(codes, self.order_, axis=1)
+        self.norms_ = np.einsum("ij,ij->i", self.evidence_, self.evidence_)
+
+    def hash(self, rows):
+        """Return an array with the hash code of each row in each table."""
+        centered = rows - self.center_
+        signs = np.einsum("nd,tdb->tnb", centered, self.planes_) > 0
+        return signs @ self.weights_
+
+    def kneighbors_block(self, queries):
+        codes = self.hash(queries)
+        starts = np.empty_like(codes)
+        ends = np.empty_like(codes)
+        for t in range(self.n_tables):
+            starts[t] = np.searchsorted(self.sorted_codes_[t], codes[t], "left")
+            ends[t] = np.searchsorted(self.sorted_codes_[t], codes[t], "right")
+
+        # Split the block so a part gathers about CANDIDATE_LIMIT rows at most
+        parts = np.cumsum((ends - starts).sum(axis=0)) // CANDIDATE_LIMIT
+        bounds = np.concatenate(
+            [[0], np.flatnonzero(np.diff(parts)) + 1, [len(queries)]]
+        )
+        return np.concatenate([
+            self.search_buckets(queries[lo:hi], starts[:, lo:hi],
+                                ends[:, lo:hi])
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ])
+
+    def search_buckets(self, queries, starts, ends):
+        """
+        Return the nearest-neighbor indices for `queries` among the training
+        rows in the bucket ranges `starts` to `ends` of each table, without
+        a Python loop over queries.
+        """
+        k = self.n_neighbors
+
+        # Gather every (query, candidate) pair, query by query
+        lengths = (ends - starts).T.ravel()
+        tables = np.tile(np.arange(self.n_tables), len(queries))
+        offsets = np.cumsum(lengths) - lengths
+        positions = (
+            np.repeat(starts.T.ravel() - offsets, lengths)
+            + np.arange(lengths.sum())
+        )
+        rows = self.order_[np.repeat(tables, lengths), positions]
+        counts = (ends - starts).sum(axis=0)
+        owners = np.repeat(np.arange(len(queries)), counts)
+        distances = self.norms_[rows] - 2 * np.einsum(
+            "ij,ij->i", self.evidence_[rows], queries[owners]
+        )
+
+        # Pairs are grouped by query, so each of the k rounds finds the
+        # nearest remaining row of every query with one pass over the pairs,
+        # then rules that row out (it may have come from several tables)
+        found = counts > 0
+        heads = (np.cumsum(counts) - counts)[found]
+        sizes = counts[found]
+        complete = np.ones(len(heads), dtype=bool)
+        chosen = np.empty((len(heads), k), dtype=np.intp)
+        for j in range(k if len(heads) else 0):
+            best = np.minimum.reduceat(distances, heads)
+            first = np.minimum.reduceat(
+                np.where(distances == np.repeat(best, sizes),
+                         np.arange(len(rows)), len(rows)),
+                heads
+            )
+            chosen[:, j] = rows[first]
+            complete &= np.isfinite(best)
+            distances[rows == np.repeat(chosen[:, j], sizes)] = np.inf
+        found[found] = complete
+
+        result = np.empty((len(queries), k), dtype=np.intp)
+        result[found] = chosen[complete]
+
+        # Queries whose buckets hold fewer than k rows search everything
+        if not found.all():
+            result[~found] = brute_force(
+                queries[~found], self.evidence_, self.norms_, k,
+                TRAIN_BLOCK_SIZE
+            )
+        return result
@@ -0,0 +1,212 @@
+import argparse
+import io
+import os
+import selectors
+import signal
+import socket
+import stat
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from shopping import CSV_DTYPES, EVIDENCE_COLUMNS, Metrics, load_model, prepare
+
+# Rows scored together, and the longest a row waits for its batch to fill
+BATCH_SIZE = 256
+MAX_WAIT = 0.005
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Score shopping sessions with a saved model. Rows are "
+                    "read as CSV lines in the format of the training data, "
+                    "with or without the Revenue column, and one prediction "
+                    "is written per row."
+    )
+    parser.add_argument("model")
+    parser.add_argument("--socket", default=None,
+                        help="serve on this Unix socket instead of stdin")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT,
+                        help="seconds a row may wait for its batch to fill")
+    args = parser.parse_args()
+
+    scorer = Scorer(load_model(args.model))
+    if args.socket is None:
+        scorer.serve(sys.stdin.fileno(), sys.stdout.fileno(),
+                     args.batch_size, args.max_wait)
+        scorer.report()
+        return
+
+    # Serve one connection at a time until interrupted or terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(args.socket)
+    server.listen()
+    print(f"Listening on {args.socket}.", file=sys.stderr)
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                fd = connection.fileno()
+                try:
+                    scorer.serve(fd, fd, args.batch_size, args.max_wait)
+                except OSError as error:
+                    # A client that goes away must not stop the server
+                    print(f"Connection closed: {error}", file=sys.stderr)
+            scorer.report()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(args.socket)
+
+
+class Scorer():
+    """
+    Keeps a loaded model resident and scores micro-batches of CSV rows,
+    recording how long each batch took. When rows include Revenue, the
+    predictions are also scored against it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.latencies = []
+        self.rows = 0
+        self.busy = 0.0
+        self.metrics = Metrics()
+
+    def score(self, lines):
+        """
+        Return a list of predictions for a list of CSV lines (bytes). If
+        the batch cannot be parsed as a whole, its rows are scored one at a
+        time, and each row that still fails gets an "error: ..." string in
+        place of its prediction.
+        """
+        try:
+            return self.predict(lines)
+        except (ValueError, KeyError, TypeError) as error:
+            if len(lines) == 1:
+                message = " ".join(str(error).split())
+                return [f"error: {type(error).__name__}: {message}"]
+        return [
+            prediction for line in lines for prediction in self.score([line])
+        ]
+
+    def predict(self, lines):
+        """
+        Return a list of predictions for a list of CSV lines (bytes) that
+        all have the same number of fields.
+        """
+        fields = lines[0].count(b",") + 1
+        names = EVIDENCE_COLUMNS + ["Revenue"]
+        if fields not in [len(names) - 1, len(names)]:
+            raise ValueError(f"Expected {len(names) - 1} or {len(names)} "
+                             f"fields, saw {fields}")
+        rows = pd.read_csv(
+            io.BytesIO(b"\n".join(lines)),
+            header=None,
+            names=names[:fields],
+            dtype={name: CSV_DTYPES[name] for name in names[:fields]}
+        )
+        evidence, labels = prepare(rows)
+        predictions = np.asarray(self.model.predict(evidence))
+        if labels is not None:
+            self.metrics.update(labels, predictions)
+        return predictions.tolist()
+
+    def serve(self, infd, outfd, batch_size, max_wait):
+        """
+        Read CSV rows from file descriptor `infd` until end of input and
+        write one prediction per line to `outfd`. A header line is skipped.
+        """
+        for lines, arrived in micro_batches(infd, batch_size, max_wait):
+            if lines[0].startswith(b"Administrative,"):
+                lines = lines[1:]
+                if not lines:
+                    continue
+            start = time.perf_counter()
+            predictions = self.score(lines)
+            output = "".join(f"{p}\n" for p in predictions).encode()
+            while output:
+                output = output[os.write(outfd, output):]
+            done = time.perf_counter()
+            self.busy += done - start
+            self.rows += len(lines)
+            self.latencies.append(done - arrived)
+
+    def report(self):
+        """Print latency percentiles and throughput to stderr."""
+        if not self.latencies:
+            return
+        latencies = 1000 * np.array(self.latencies)
+        print(f"Rows: {self.rows} in {len(latencies)} batches, "
+              f"latency p50 {np.percentile(latencies, 50):.2f} ms, "
+              f"p99 {np.percentile(latencies, 99):.2f} ms, "
+              f"{self.rows / self.busy:.0f} rows/s while scoring",
+              file=sys.stderr)
+        if self.metrics.counts.any():
+            print(f"Correct: {self.metrics.correct}, "
+                  f"Incorrect: {self.metrics.incorrect}, "
+                  f"True Positive Rate: {100 * self.metrics.sensitivity:.2f}%, "
+                  f"True Negative Rate: {100 * self.metrics.specificity:.2f}%",
+                  file=sys.stderr)
+
+
+def micro_batches(fd, batch_size, max_wait):
+    """
+    Read lines from file descriptor `fd` and yield them in batches of up to
+    `batch_size` non-empty lines. A partial batch is yielded once its first
+    line has waited `max_wait` seconds, or at end of input. Each batch comes
+    with the time (time.perf_counter) its first line arrived. Regular files
+    never block, so they are read directly in full batches.
+    """
+    selector = None
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
+    buffer = b""
+    batch = []
+    arrived = None
+    while True:
+        timeout = None
+        if batch:
+            timeout = max(0.0, arrived + max_wait - time.perf_counter())
+        if selector is None or selector.select(timeout):
+            data = os.read(fd, 1 << 16)
+            if not data:
+                break
+            now = time.perf_counter()
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                if not batch:
+                    arrived = now
+                batch.append(line)
+                if len(batch) == batch_size:
+                    yield batch, arrived
+                    batch = []
+        elif batch:
+            yield batch, arrived
+            batch = []
+    if selector is not None:
+        selector.unregister(fd)
+        selector.close()
+    if buffer.strip():
+        if not batch:
+            arrived = time.perf_counter()
+        batch.append(buffer.strip())
+    if batch:
+        yield batch, arrived
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,70 @@
+import json
+import os
+import shutil
 import sys
 
 from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsClassifier
-from sklearn.metrics import confusion_matrix
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+import joblib
 import pandas as pd
 import numpy as np
 
+from neighbors import BlockedBruteForce, RandomProjectionLSH
+
 TEST_SIZE = 0.4
 
+# Rows parsed at a time when loading a CSV
+CHUNK_SIZE = 100_000
+
+# Bump to invalidate existing column caches
+CACHE_VERSION = 1
+
+# Bump when saved models can no longer be loaded
+MODEL_VERSION = 2
+
+MONTH_TO_INDEX = {
+    "Jan": 0, "Feb": 1, "Mar": 2, "Apr": 3, "May": 4, "June": 5,
+    "Jul": 6, "Aug": 7, "Sep": 8, "Oct": 9, "Nov": 10, "Dec": 11
+}
+
+# Column types used when parsing the CSV
+CSV_DTYPES = {
+    "Administrative": np.int16,
+    "Administrative_Duration": np.float32,
+    "Informational": np.int16,
+    "Informational_Duration": np.float32,
+    "ProductRelated": np.int16,
+    "ProductRelated_Duration": np.float32,
+    "BounceRates": np.float32,
+    "ExitRates": np.float32,
+    "PageValues": np.float32,
+    "SpecialDay": np.float32,
+    "Month": "category",
+    "OperatingSystems": np.int8,
+    "Browser": np.int8,
+    "Region": np.int8,
+    "TrafficType": np.int8,
+    "VisitorType": "category",
+    "Weekend": bool,
+    "Revenue": bool
+}
+
+EVIDENCE_COLUMNS = [column for column in CSV_DTYPES if column != "Revenue"]
+
+# Ways of finding nearest neighbors; see train_model
+BACKENDS = ["exact", "kd_tree", "ball_tree", "brute", "lsh"]
+
 
 def main():
 
     # Check command-line arguments
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python shopping.py data")
+    if len(sys.argv) not in [2, 3, 4]:
+        sys.exit("Usage: python shopping.py data [backend] [model]")
+    backend = sys.argv[2] if len(sys.argv) >= 3 else "exact"
+    if backend not in BACKENDS:
+        sys.exit(f"Backend must be one of: {', '.join(BACKENDS)}")
 
     # Load data from spreadsheet and split into train and test sets
     evidence, labels = load_data(sys.argv[1])
@@ -22,18 +73,25 @@ def main():
     )
 
     # Train model and make predictions
-    model = train_model(X_train, y_train)
+    model = train_model(X_train, y_train, backend)
     predictions = model.predict(X_test)
-    sensitivity, specificity = evaluate(y_test, predictions)
+    metrics = Metrics()
+    metrics.update(y_test, predictions)
 
     # Print results
-    print(f"Correct: {(y_test == predictions).sum()}")
-    print(f"Incorrect: {(y_test != predictions).sum()}")
-    print(f"True Positive Rate: {100 * sensitivity:.2f}%")
-    print(f"True Negative Rate: {100 * specificity:.2f}%")
+    print(f"Correct: {metrics.correct}")
+    print(f"Incorrect: {metrics.incorrect}")
+    print(f"True Positive Rate: {100 * metrics.sensitivity:.2f}%")
+    print(f"True Negative Rate: {100 * metrics.specificity:.2f}%")
+
+    # Save model to file
+    if len(sys.argv) == 4:
+        filename = sys.argv[3]
+        save_model(model, filename, backend)
+        print(f"Model saved to {filename}.")
 
 
-def load_data(filename):
+def load_data(filename, cache=True):
     """
     Load shopping data from a CSV file `filename` and convert into a list of
     evidence lists and a list of labels. Return a tuple (evidence, labels).
@@ -60,31 +118,178 @@ def load_data(filename):
 
     labels should be the corresponding list of labels, where each label
     is 1 if Revenue is true, and 0 otherwise.
+
+    Columns are loaded with compact types (see CSV_DTYPES). Unless `cache`
+    is False, the parsed columns are saved next to `filename` on the first
+    load, and later loads memory-map them instead of parsing the CSV again.
+    """
+    if cache:
+        cached = read_cache(filename)
+        if cached is not None:
+            return cached
+
+    # Parse the file in chunks with explicit, compact column types
+    evidence_chunks = []
+    label_chunks = []
+    for chunk in pd.read_csv(filename, dtype=CSV_DTYPES, chunksize=CHUNK_SIZE):
+        evidence, labels = prepare(chunk)
+        evidence_chunks.append(evidence)
+        label_chunks.append(labels)
+    evidence = pd.concat(evidence_chunks, ignore_index=True)
+    labels = pd.concat(label_chunks, ignore_index=True)
+
+    # Without a cache, the parsed data is just as good
+    if cache:
+        try:
+            write_cache(filename, evidence, labels)
+        except OSError as e:
+            print(f"Could not cache {filename}: {e}", file=sys.stderr)
+    return evidence, labels
+
+
+def prepare(rows):
+    """
+    Convert a DataFrame `rows` parsed with CSV_DTYPES into a tuple
+    (evidence, labels) as described in `load_data`. If `rows` has no
+    Revenue column, labels is None.
+    """
+    evidence = rows[EVIDENCE_COLUMNS].copy()
+    evidence["Month"] = evidence["Month"].map(MONTH_TO_INDEX).astype(np.int8)
+    evidence["VisitorType"] = (
+        evidence["VisitorType"] == "Returning_Visitor"
+    ).astype(np.int8)
+    evidence["Weekend"] = evidence["Weekend"].astype(np.int8)
+    labels = rows["Revenue"].astype(np.int8) if "Revenue" in rows else None
+    return evidence, labels
+
+
+def cache_path(filename):
+    """Return the directory in which the columns of `filename` are cached."""
+    return f"{filename}.cache"
+
+
+def cache_key(filename):
+    """
+    Return a dict identifying the current contents of `filename`; a cache
+    is only used if it was written for the same key.
+    """
+    stat = os.stat(filename)
+    return {
+        "version": CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns
+    }
+
+
+def read_cache(filename):
+    """
+    Return (evidence, labels) memory-mapped from the column cache of
+    `filename`, or None if there is no cache or it is out of date.
     """
-    
-    dataset = pd.read_csv(filename)
-   
-    month_to_index = {'Jan': 0, 'Feb': 1, 'Mar': 2, 'Apr': 3, 'May': 4, 'June': 5, 'Jul': 6, 'Aug': 7, 'Sep': 8,  'Oct': 9, 'Nov': 10, 'Dec': 11}
-    dataset["Month"] = dataset['Month'].map(month_to_index)
-    
-    dataset['VisitorType'] = np.where(dataset['VisitorType'] == 'Returning_Visitor', 1, 0)
-    
-    labels = dataset['Revenue']
-    dataset.drop(['Revenue'], inplace=True, axis=1)
+    directory = cache_path(filename)
+    try:
+        with open(os.path.join(directory, "key.json")) as f:
+            if json.load(f) != cache_key(filename):
+                return None
+        columns = {
+            column: np.load(os.path.join(directory, f"{column}.npy"),
+                            mmap_mode="r")
+            for column in EVIDENCE_COLUMNS
+        }
+        labels = np.load(os.path.join(directory, "Revenue.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return (
+        pd.DataFrame(columns, copy=False),
+        pd.Series(labels, name="Revenue", copy=False)
+    )
 
-    return dataset, labels
+
+def write_cache(filename, evidence, labels):
+    """
+    Save each column of `evidence` and `labels` as a .npy file in the
+    column cache of `filename`, replacing any previous cache. If the cache
+    cannot be written, nothing is left behind and OSError is raised.
+    """
+    directory = cache_path(filename)
+    staging = f"{directory}.tmp{os.getpid()}"
+    try:
+        os.makedirs(staging, exist_ok=True)
+        for column in EVIDENCE_COLUMNS:
+            np.save(os.path.join(staging, f"{column}.npy"),
+                    evidence[column].to_numpy())
+        np.save(os.path.join(staging, "Revenue.npy"), labels.to_numpy())
+        with open(os.path.join(staging, "key.json"), "w") as f:
+            json.dump(cache_key(filename), f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
 
 
-def train_model(evidence, labels):
+def train_model(evidence, labels, backend="exact", n_neighbors=1):
     """
     Given a list of evidence lists and a list of labels, return a
     fitted k-nearest neighbor model (k=1) trained on the data.
+
+    `backend` chooses how neighbors are found:
+        - exact, scikit-learn's default search on the raw features
+        - kd_tree or ball_tree, a tree on standardized features
+        - brute, blocked float32 brute force on standardized features
+        - lsh, approximate random-projection hashing on standardized
+          features
+    All but exact answer batches of queries in parallel.
     """
-    model = KNeighborsClassifier(n_neighbors=1)
+    if backend == "exact":
+        model = KNeighborsClassifier(n_neighbors=n_neighbors)
+    elif backend in ["kd_tree", "ball_tree"]:
+        model = make_pipeline(
+            StandardScaler(),
+            KNeighborsClassifier(
+                n_neighbors=n_neighbors, algorithm=backend, n_jobs=-1
+            )
+        )
+    elif backend == "brute":
+        model = make_pipeline(
+            StandardScaler(), BlockedBruteForce(n_neighbors=n_neighbors)
+        )
+    elif backend == "lsh":
+        model = make_pipeline(
+            StandardScaler(), RandomProjectionLSH(n_neighbors=n_neighbors)
+        )
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
     model.fit(evidence, labels)
     return model
 
 
+def save_model(model, filename, backend="exact"):
+    """
+    Save a model returned by `train_model`, including any preprocessing
+    and its neighbor index, to `filename`.
+    """
+    joblib.dump({
+        "version": MODEL_VERSION,
+        "backend": backend,
+        "columns": EVIDENCE_COLUMNS,
+        "model": model
+    }, filename)
+
+
+def load_model(filename):
+    """
+    Load a model saved by `save_model`, ready to predict. Raise ValueError
+    if the file was saved by an incompatible version.
+    """
+    saved = joblib.load(filename)
+    if saved.get("version") != MODEL_VERSION:
+        raise ValueError(f"{filename} was saved by an incompatible version")
+    if saved["columns"] != EVIDENCE_COLUMNS:
+        raise ValueError(f"{filename} was trained on different columns")
+    return saved["model"]
+
+
 def evaluate(labels, predictions):
     """
     Given a list of actual labels and a list of predicted labels,
@@ -100,12 +305,53 @@ def evaluate(labels, predictions):
     representing the "true negative rate": the proportion of
     actual negative labels that were accurately identified.
     """ 
-    tn, fp, fn, tp = confusion_matrix(labels, predictions).ravel()
+    metrics = Metrics()
+    metrics.update(labels, predictions)
+    return metrics.sensitivity, metrics.specificity
+
+
+class Metrics():
+    """
+    Confusion counts accumulated over chunks of (labels, predictions), so
+    metrics over any number of rows are computed in one pass with constant
+    memory. Each label and prediction is either a 1 (positive) or 0
+    (negative).
+    """
+
+    def __init__(self):
+        # Counts of true negatives, false positives, false negatives and
+        # true positives, indexed by 2 * label + prediction
+        self.counts = np.zeros(4, dtype=np.int64)
+
+    def update(self, labels, predictions):
+        """Add a chunk of actual labels and predicted labels to the counts."""
+        labels = np.asarray(labels, dtype=np.intp)
+        predictions = np.asarray(predictions, dtype=np.intp)
+        self.counts += np.bincount(2 * labels + predictions, minlength=4)
+
+    @property
+    def correct(self):
+        """Number of rows predicted correctly."""
+        tn, fp, fn, tp = self.counts
+        return int(tn + tp)
+
+    @property
+    def incorrect(self):
+        """Number of rows predicted incorrectly."""
+        tn, fp, fn, tp = self.counts
+        return int(fp + fn)
+
+    @property
+    def sensitivity(self):
+        """True positive rate, or nan if there were no positive labels."""
+        tn, fp, fn, tp = self.counts
+        return tp / (tp + fn) if tp + fn else float("nan")
 
-# Calculate true positive rate (TPR) and true negative rate (TNR)
-    sensitivity = tp / (tp + fn)
-    specificity = tn / (tn + fp)
-    return sensitivity, specificity
+    @property
+    def specificity(self):
+        """True negative rate, or nan if there were no negative labels."""
+        tn, fp, fn, tp = self.counts
+        return tn / (tn + fp) if tn + fp else float("nan")
 
 
 
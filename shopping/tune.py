@@ -0,0 +1,140 @@
+import argparse
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sklearn.model_selection import StratifiedKFold
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import StandardScaler
+
+from neighbors import vote
+from shopping import evaluate, load_data
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Cross-validate k-nearest-neighbor models over a grid "
+                    "of k values and distance metrics."
+    )
+    parser.add_argument("data")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 7, 9, 15],
+                        help="numbers of neighbors to try")
+    parser.add_argument("--metrics", nargs="+",
+                        default=["euclidean", "manhattan"],
+                        help="distance metrics to try")
+    parser.add_argument("--raw", action="store_true",
+                        help="do not standardize the features")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    evidence, labels = load_data(args.data)
+    results = tune(
+        np.asarray(evidence, dtype=np.float32), np.asarray(labels),
+        args.k, args.metrics, folds=args.folds, scale=not args.raw,
+        workers=args.workers, seed=args.seed
+    )
+    elapsed = time.perf_counter() - start
+
+    # Print mean results over the folds, best first
+    print(f"{'metric':<12}{'k':>4}{'accuracy':>10}{'TPR':>9}{'TNR':>9}"
+          f"{'TPR+TNR':>10}")
+    for result in sorted(results, key=lambda r: -r["balanced"]):
+        print(f"{result['metric']:<12}{result['k']:>4}"
+              f"{100 * result['accuracy']:>9.2f}%"
+              f"{100 * result['sensitivity']:>8.2f}%"
+              f"{100 * result['specificity']:>8.2f}%"
+              f"{100 * result['balanced']:>9.2f}%")
+    print()
+    print(f"{args.folds} folds x {len(args.metrics)} metrics x "
+          f"{len(args.k)} values of k in {elapsed:.2f}s")
+
+
+def tune(evidence, labels, ks, metrics, folds=5, scale=True, workers=None,
+         seed=0):
+    """
+    Run stratified `folds`-fold cross-validation of k-nearest-neighbor
+    classification for every k in `ks` and every distance metric in
+    `metrics`, one process per (fold, metric). Neighbors are searched once
+    per (fold, metric), up to the largest k, and the ordering is reused for
+    every k.
+
+    Return a list of dicts, one per (metric, k), with the mean accuracy,
+    sensitivity and specificity over the folds.
+    """
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    jobs = [
+        (train, test, metric, sorted(ks), scale)
+        for train, test in splitter.split(evidence, labels)
+        for metric in metrics
+    ]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=share_data,
+        initargs=(evidence, labels)
+    ) as pool:
+        fold_results = list(pool.map(run_fold, jobs))
+
+    results = []
+    for metric in metrics:
+        for k in sorted(ks):
+            scores = [
+                fold[k] for job, fold in zip(jobs, fold_results)
+                if job[2] == metric
+            ]
+            accuracy, sensitivity, specificity = np.mean(scores, axis=0)
+            results.append({
+                "metric": metric,
+                "k": k,
+                "accuracy": accuracy,
+                "sensitivity": sensitivity,
+                "specificity": specificity,
+                "balanced": (sensitivity + specificity) / 2
+            })
+    return results
+
+
+# Evidence and labels of each `tune` worker process, sent once per worker
+shared_data = None
+
+
+def share_data(evidence, labels):
+    """Keep the data a `tune` worker process scores folds of."""
+    global shared_data
+    shared_data = (evidence, labels)
+
+
+def run_fold(job):
+    """
+    Score one (fold, metric) pair for every k. Return a dict mapping each k
+    to (accuracy, sensitivity, specificity) on the fold's test rows.
+    """
+    evidence, labels = shared_data
+    train, test, metric, ks, scale = job
+    X_train, X_test = evidence[train], evidence[test]
+    if scale:
+        scaler = StandardScaler().fit(X_train)
+        X_train, X_test = scaler.transform(X_train), scaler.transform(X_test)
+
+    # Neighbor ordering up to the largest k, shared by every k
+    classes, encoded = np.unique(labels[train], return_inverse=True)
+    index = NearestNeighbors(n_neighbors=max(ks), metric=metric)
+    index.fit(X_train)
+    neighbors = encoded[index.kneighbors(X_test, return_distance=False)]
+
+    scores = dict()
+    for k in ks:
+        predictions = classes[vote(neighbors[:, :k], len(classes))]
+        sensitivity, specificity = evaluate(labels[test], predictions)
+        accuracy = (labels[test] == predictions).mean()
+        scores[k] = (accuracy, sensitivity, specificity)
+    return scores
+
+
+if __name__ == "__main__":
+    main()
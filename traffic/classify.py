@@ -0,0 +1,210 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from quantize import KerasPredictor, TFLitePredictor
+from traffic import decode_images
+
+# Images classified together, and the longest a path waits for its batch
+# to fill
+BATCH_SIZE = 64
+MAX_WAIT = 0.01
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Classify traffic sign images with a saved model. For "
+                    "each image, a line with its path, predicted category "
+                    "and confidence is written, separated by tabs."
+    )
+    parser.add_argument("model", help="a Keras model or a .tflite file")
+    parser.add_argument("images",
+                        help="a directory of images, or - to read one image "
+                             "path per line from stdin")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT,
+                        help="seconds a path may wait for its batch to fill")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="processes decoding images")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="threads used by a .tflite model")
+    args = parser.parse_args()
+
+    if args.images == "-":
+        paths = (line.strip() for line in sys.stdin if line.strip())
+    else:
+        paths = image_paths(args.images)
+
+    classifier = Classifier(load_predictor(args.model, args.threads))
+    classifier.serve(paths, sys.stdout, args.batch_size, args.workers,
+                     args.max_wait)
+    classifier.report()
+
+
+def load_predictor(filename, threads=None):
+    """
+    Load the model saved in `filename`, which is either a TensorFlow Lite
+    model (see quantize.py) or a Keras model saved by traffic.py.
+    """
+    if filename.endswith(".tflite"):
+        return TFLitePredictor(filename, threads)
+    return KerasPredictor(tf.keras.models.load_model(filename))
+
+
+def image_paths(directory):
+    """Yield the path of every file under `directory`, in sorted order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            yield os.path.join(root, filename)
+
+
+class Classifier():
+    """
+    Keeps a loaded model resident and classifies batches of image files,
+    recording how long each batch took to predict.
+    """
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.latencies = []
+        self.images = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def classify(self, pixels):
+        """
+        Return arrays of the predicted category and its probability for each
+        of the uint8 images in `pixels`.
+        """
+        probabilities = self.predictor.predict(
+            pixels.astype(np.float32) / 255
+        )
+        categories = probabilities.argmax(axis=1)
+        return categories, probabilities[np.arange(len(categories)), categories]
+
+    def serve(self, paths, output, batch_size, workers, max_wait=MAX_WAIT):
+        """
+        Classify every image in the iterable `paths` and write one line per
+        image to `output`. A pool of `workers` processes decodes upcoming
+        batches while the current one is predicted; a partial batch is
+        decoded once its first path has waited `max_wait` seconds, so a live
+        stream of paths is classified as it arrives. Unreadable files are
+        reported on stderr and skipped.
+        """
+        start = time.perf_counter()
+        with ProcessPoolExecutor(workers) as pool:
+            for batch, future in read_ahead(
+                paths, lambda batch: pool.submit(decode_images, batch),
+                batch_size, max_wait, 2 * workers
+            ):
+                pixels, readable = future.result()
+                for path in np.array(batch, dtype=object)[~readable]:
+                    print(f"Skipped unreadable file {path}", file=sys.stderr)
+                self.skipped += len(batch) - len(pixels)
+                if not len(pixels):
+                    continue
+
+                predicted = time.perf_counter()
+                categories, confidences = self.classify(pixels)
+                self.latencies.append(time.perf_counter() - predicted)
+                self.images += len(pixels)
+                output.write("".join(
+                    f"{path}\t{category}\t{confidence:.4f}\n"
+                    for path, category, confidence in zip(
+                        np.array(batch, dtype=object)[readable],
+                        categories, confidences
+                    )
+                ))
+                output.flush()
+        self.elapsed += time.perf_counter() - start
+
+    def report(self):
+        """Print per-batch latency percentiles and throughput to stderr."""
+        if not self.latencies:
+            return
+        latencies = 1000 * np.array(self.latencies)
+        print(f"Images: {self.images} in {len(latencies)} batches "
+              f"({self.skipped} skipped), "
+              f"batch latency p50 {np.percentile(latencies, 50):.2f} ms, "
+              f"p99 {np.percentile(latencies, 99):.2f} ms, "
+              f"{self.images / self.elapsed:.0f} images/s overall, "
+              f"{self.images / latencies.sum() * 1000:.0f} images/s "
+              f"while predicting",
+              file=sys.stderr)
+
+
+def read_ahead(items, submit, batch_size, max_wait, ahead):
+    """
+    Yield `(batch, submit(batch))` pairs, in order, for batches of up to
+    `batch_size` items from the iterable `items`. A partial batch is
+    submitted once its first item has waited `max_wait` seconds, or at the
+    end of `items`, and up to `ahead` batches are submitted before they are
+    yielded. Items are read and batched in background threads, so waiting
+    for input never holds up batches that are already submitted.
+    """
+    end = object()
+    arrivals = queue.Queue(batch_size)
+    submitted = queue.Queue(ahead)
+    errors = []
+
+    def read():
+        try:
+            for item in items:
+                arrivals.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            arrivals.put(end)
+
+    def gather():
+        batch = []
+        deadline = None
+        try:
+            while True:
+                timeout = None
+                if batch:
+                    timeout = max(0.0, deadline - time.perf_counter())
+                try:
+                    item = arrivals.get(timeout=timeout)
+                except queue.Empty:
+                    # The partial batch has waited long enough
+                    item = None
+                if item is not None and item is not end:
+                    batch.append(item)
+                    if len(batch) == 1:
+                        deadline = time.perf_counter() + max_wait
+                    if len(batch) < batch_size:
+                        continue
+                if batch:
+                    submitted.put((batch, submit(batch)))
+                    batch = []
+                if item is end:
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            submitted.put(end)
+
+    for target in [read, gather]:
+        threading.Thread(target=target, daemon=True).start()
+    while True:
+        entry = submitted.get()
+        if entry is end:
+            break
+        yield entry
+    if errors:
+        raise errors[0]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import tensorflow as tf
+
+from traffic import (
+    BATCH_SIZE, EPOCHS, IMG_HEIGHT, IMG_WIDTH, SEED, get_model, image_reader,
+    load_datasets
+)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Train the traffic sign network data-parallel across "
+                    "local worker processes, each reading its own shard of "
+                    "the training images."
+    )
+    parser.add_argument("data_directory")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--scaling", type=int, nargs="+", default=None,
+                        metavar="WORKERS",
+                        help="train once with each of these worker counts "
+                             "and report scaling efficiency, e.g. 1 2 4 8")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--intra-threads", type=int, default=None,
+                        help="threads per op in each worker (default: "
+                             "cores divided between workers)")
+    parser.add_argument("--inter-threads", type=int, default=None,
+                        help="ops run at once in each worker (default: "
+                             "cores divided between workers)")
+
+    # Set by the launcher for the worker processes it starts
+    parser.add_argument("--worker-index", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ports", type=int, nargs="+", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_index is not None:
+        run_worker(args)
+        return
+
+    # Build the image cache once, rather than in every worker at once
+    image_reader(args.data_directory)
+
+    counts = args.scaling or [args.workers]
+    results = [launch(workers, args) for workers in counts]
+
+    # Speedup is relative to the first run's throughput per worker
+    base = results[0]["samples_per_sec"] / results[0]["workers"]
+    print(f"{'workers':>7}{'train s':>9}{'samples/s':>11}{'speedup':>9}"
+          f"{'efficiency':>12}{'accuracy':>10}")
+    for result in results:
+        speedup = result["samples_per_sec"] / base
+        print(f"{result['workers']:>7}{result['seconds']:>9.1f}"
+              f"{result['samples_per_sec']:>11.0f}{speedup:>9.2f}"
+              f"{100 * speedup / result['workers']:>11.1f}%"
+              f"{100 * result['accuracy']:>9.2f}%")
+
+
+def launch(workers, args):
+    """
+    Start `workers` worker processes on free localhost ports, wait for them
+    to finish training, and return the result reported by the chief.
+    """
+    ports = free_ports(workers)
+    threads = max(1, os.cpu_count() // workers)
+    with tempfile.NamedTemporaryFile(suffix=".json") as result:
+        processes = [
+            subprocess.Popen([
+                sys.executable, os.path.abspath(__file__), args.data_directory,
+                "--epochs", str(args.epochs),
+                "--intra-threads", str(args.intra_threads or threads),
+                "--inter-threads", str(args.inter_threads or threads),
+                "--worker-index", str(index),
+                "--ports", *map(str, ports),
+                "--result", result.name
+            ])
+            for index in range(workers)
+        ]
+        if any(process.wait() for process in processes):
+            sys.exit(f"A worker failed while training with {workers} workers.")
+        with open(result.name) as f:
+            return json.load(f)
+
+
+def free_ports(count):
+    """Return `count` distinct TCP ports that are free on localhost."""
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(("localhost", 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def run_worker(args):
+    """
+    Train as worker `args.worker_index` of a cluster on `args.ports`. The
+    chief (worker 0) writes the training time, throughput and test accuracy
+    to `args.result`.
+    """
+    workers = len(args.ports)
+    os.environ["TF_CONFIG"] = json.dumps({
+        "cluster": {"worker": [f"localhost:{port}" for port in args.ports]},
+        "task": {"type": "worker", "index": args.worker_index}
+    })
+    tf.config.threading.set_intra_op_parallelism_threads(args.intra_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(args.inter_threads)
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+
+    # Each worker reads only its own shard, so turn off automatic sharding;
+    # shards are the same size, so every worker takes the same steps
+    train, test = load_datasets(
+        args.data_directory, seed=SEED, shard=(workers, args.worker_index)
+    )
+    steps = int(train.cardinality())
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = (
+        tf.data.experimental.AutoShardPolicy.OFF
+    )
+    train = train.repeat().with_options(options)
+
+    with strategy.scope():
+        model = get_model()
+        model.build((None, IMG_HEIGHT, IMG_WIDTH, 3))
+        model.optimizer.build(model.trainable_variables)
+
+    # The global batch grows with the workers, so scale the learning rate
+    # with it to take steps of the same size per example seen
+    model.optimizer.learning_rate.assign(
+        model.optimizer.learning_rate * workers
+    )
+
+    # Keras' fit cannot yet run under a multi-worker strategy, so step the
+    # optimizer in a loop of our own. Keras losses already divide by the
+    # number of replicas, so their sum is the mean over the global batch
+    loss = tf.keras.losses.CategoricalCrossentropy(
+        reduction="sum_over_batch_size"
+    )
+
+    @tf.function
+    def train_step(iterator):
+        def step(images, labels):
+            with tf.GradientTape() as tape:
+                predictions = model(images, training=True)
+                batch_loss = loss(labels, predictions)
+            gradients = tape.gradient(batch_loss, model.trainable_variables)
+            model.optimizer.apply_gradients(
+                zip(gradients, model.trainable_variables)
+            )
+            return batch_loss
+        return strategy.reduce(
+            "SUM", strategy.run(step, args=next(iterator)), axis=None
+        )
+
+    @tf.function
+    def barrier():
+        return strategy.reduce(
+            "SUM", strategy.run(lambda: tf.constant(1)), axis=None
+        )
+
+    @tf.function
+    def predict(images):
+        return model(images, training=False)
+
+    chief = args.worker_index == 0
+    iterator = iter(strategy.experimental_distribute_dataset(train))
+    start = time.perf_counter()
+    for epoch in range(args.epochs):
+        total = 0.0
+        for _ in range(steps):
+            total += train_step(iterator)
+        if chief:
+            print(f"Epoch {epoch + 1}/{args.epochs}: "
+                  f"loss {float(total) / steps:.4f}", file=sys.stderr)
+    seconds = time.perf_counter() - start
+
+    # The chief evaluates the whole test set on its own, so its metric is
+    # kept out of the strategy to avoid reducing it across workers
+    if chief:
+        accuracy = tf.keras.metrics.CategoricalAccuracy()
+        for images, labels in test:
+            accuracy.update_state(labels, predict(images))
+        samples = args.epochs * steps * BATCH_SIZE * workers
+        with open(args.result, "w") as f:
+            json.dump({
+                "workers": workers,
+                "seconds": seconds,
+                "samples_per_sec": samples / seconds,
+                "accuracy": float(accuracy.result())
+            }, f)
+
+    # Wait for the chief before exiting, since a worker that leaves the
+    # cluster early is reported as having crashed
+    barrier()
+
+
+if __name__ == "__main__":
+    main()
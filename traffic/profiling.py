@@ -0,0 +1,152 @@
+import json
+import resource
+import sys
+import time
+
+import tensorflow as tf
+
+
+class TrainingProfiler(tf.keras.callbacks.Callback):
+    """
+    Times training and writes what it measures to a log of JSON lines.
+
+    For each step and epoch, the log records wall time, samples per second,
+    and how that time divides between waiting on the input pipeline and
+    running the train step, along with the peak resident set size of the
+    process. Splitting input wait from compute needs the training dataset
+    to be wrapped with `watch`, since the batch is fetched inside the step.
+    The first step of training also traces the train function, so its time
+    is all counted as compute.
+
+    If `trace_steps` is a (first, last) pair of global step numbers, a
+    TensorFlow profiler trace of those steps is written to `trace_dir`.
+    """
+
+    def __init__(self, log_file, log_steps=True, trace_steps=None,
+                 trace_dir="profile"):
+        super().__init__()
+        self.log_file = log_file
+        self.log_steps = log_steps
+        self.trace_steps = trace_steps
+        self.trace_dir = trace_dir
+        self.log = None
+        self.received = {}
+        self.watching = False
+        self.global_step = 0
+        self.tracing = False
+
+    def watch(self, dataset):
+        """
+        Return `dataset` with a final step that notes when each batch leaves
+        the pipeline, and its size, under its position in the epoch. The
+        pipeline runs ahead of training, so stamps are matched to steps by
+        position rather than by when they arrive.
+        """
+        def stamp(step, batch):
+            images, labels = batch
+            size = tf.py_function(
+                self.receive, [step, tf.shape(images)[0]], tf.int64
+            )
+            with tf.control_dependencies([size]):
+                return tf.identity(images), labels
+        self.watching = True
+        return dataset.enumerate().map(stamp)
+
+    def receive(self, step, size):
+        self.received[int(step)] = (time.perf_counter(), int(size))
+        return 0
+
+    def write(self, event, **fields):
+        self.log.write(json.dumps({"event": event, **fields}) + "\n")
+
+    def on_train_begin(self, logs=None):
+        self.log = open(self.log_file, "a")
+        self.write("train_begin", time=time.time(),
+                   epochs=self.params.get("epochs"))
+
+    def on_train_end(self, logs=None):
+        if self.tracing:
+            tf.profiler.experimental.stop()
+            self.tracing = False
+        self.write("train_end", time=time.time(), peak_rss_mb=peak_rss_mb())
+        self.log.close()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.epoch_start = time.perf_counter()
+        self.steps = 0
+        self.samples = 0
+        self.unmatched = 0
+        self.wait = 0.0
+        self.compute = 0.0
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        fields = {
+            "epoch": epoch,
+            "time": elapsed,
+            "steps": self.steps,
+            "samples": self.samples,
+            "unmatched_steps": self.unmatched,
+            "unmatched_batches": len(self.received),
+            "samples_per_sec": self.samples / elapsed,
+            "input_wait": self.wait,
+            "compute": self.compute,
+            "peak_rss_mb": peak_rss_mb(),
+            **{name: float(value) for name, value in (logs or {}).items()}
+        }
+        self.write("epoch", **fields)
+        print(f"Epoch {epoch + 1}: {elapsed:.2f}s, "
+              f"{fields['samples_per_sec']:.0f} samples/s, "
+              f"input wait {self.wait:.2f}s, compute {self.compute:.2f}s, "
+              f"peak RSS {fields['peak_rss_mb']:.0f} MB",
+              file=sys.stderr)
+
+        # Every step should have claimed exactly one batch of the epoch, so
+        # that the step sample counts add up to the size of the dataset
+        if self.watching and (self.unmatched or self.received):
+            print(f"Warning: {self.unmatched} steps without a batch stamp "
+                  f"and {len(self.received)} unclaimed batches in epoch "
+                  f"{epoch + 1}; input wait and sample counts are incomplete",
+                  file=sys.stderr)
+        self.received.clear()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.trace_steps and self.global_step == self.trace_steps[0]:
+            tf.profiler.experimental.start(self.trace_dir)
+            self.tracing = True
+        self.step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        end = time.perf_counter()
+        elapsed = end - self.step_start
+
+        # Without a stamp from `watch`, count the whole step as compute
+        stamp = self.received.pop(batch, None)
+        if stamp is None:
+            size, wait = 0, 0.0
+            self.unmatched += self.watching
+        else:
+            received, size = stamp
+            wait = max(0.0, received - self.step_start)
+            if self.global_step == 0:
+                wait = 0.0
+        self.steps += 1
+        self.samples += size
+        self.wait += wait
+        self.compute += elapsed - wait
+        if self.log_steps:
+            self.write("step", epoch=self.epoch, step=batch,
+                       global_step=self.global_step,
+                       time=elapsed, samples=size, input_wait=wait,
+                       compute=elapsed - wait)
+
+        if self.tracing and self.global_step == self.trace_steps[1]:
+            tf.profiler.experimental.stop()
+            self.tracing = False
+        self.global_step += 1
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process, in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from traffic import SEED, load_data, split_indices
+
+# tf.lite.Interpreter is deprecated in favor of the LiteRT package
+try:
+    from ai_edge_litert.interpreter import Interpreter
+except ImportError:
+    Interpreter = tf.lite.Interpreter
+
+# Images fed to the converter to calibrate int8 activation ranges
+REPRESENTATIVE_IMAGES = 300
+
+# Images per batch when measuring throughput
+BATCH_SIZE = 256
+
+# Images classified one at a time to measure single-image latency
+LATENCY_IMAGES = 200
+
+# Ways of converting the model; see convert
+MODES = ["float32", "dynamic", "int8"]
+
+
+def main():
+
+    # Check command-line arguments
+    if len(sys.argv) not in [3, 4]:
+        sys.exit("Usage: python quantize.py model.h5 data_directory [threads]")
+    threads = int(sys.argv[3]) if len(sys.argv) == 4 else None
+
+    model = tf.keras.models.load_model(sys.argv[1])
+    images, labels = load_data(sys.argv[2])
+
+    # Calibrate on training images and measure on the test images held out
+    # when traffic.py trained the model
+    train, test = split_indices(len(images), SEED)
+    rng = np.random.default_rng(0)
+    sample = images[rng.choice(
+        train, min(REPRESENTATIVE_IMAGES, len(train)), replace=False
+    )]
+    images, labels = images[test], labels[test]
+
+    # Export a converted copy of the model next to the original
+    base = os.path.splitext(sys.argv[1])[0]
+    filenames = {}
+    for mode in MODES:
+        filenames[mode] = f"{base}-{mode}.tflite"
+        with open(filenames[mode], "wb") as f:
+            f.write(convert(model, mode, sample))
+        print(f"Model saved to {filenames[mode]}.")
+    print()
+
+    print(f"{'model':<16}{'size KB':>10}{'accuracy':>10}{'agrees':>8}"
+          f"{'ms/image':>10}{'images/s':>10}")
+    reference = None
+    predictors = [("keras", sys.argv[1], KerasPredictor(model))] + [
+        (f"tflite-{mode}", filenames[mode],
+         TFLitePredictor(filenames[mode], threads))
+        for mode in MODES
+    ]
+    for name, filename, predictor in predictors:
+        start = time.perf_counter()
+        predictions = np.concatenate([
+            predictor.predict(images[i:i + BATCH_SIZE]).argmax(axis=1)
+            for i in range(0, len(images), BATCH_SIZE)
+        ])
+        throughput = len(images) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(LATENCY_IMAGES):
+            predictor.predict(images[i:i + 1])
+        latency = (time.perf_counter() - start) / LATENCY_IMAGES
+
+        if reference is None:
+            reference = predictions
+        accuracy = (predictions == labels).mean()
+        agreement = (predictions == reference).mean()
+        print(f"{name:<16}{os.path.getsize(filename) / 1024:>10.0f}"
+              f"{100 * accuracy:>9.2f}%{100 * agreement:>7.2f}%"
+              f"{1000 * latency:>10.2f}{throughput:>10.0f}")
+
+
+def convert(model, mode, representative):
+    """
+    Convert a Keras `model` to a TensorFlow Lite flatbuffer and return its
+    bytes.
+
+    `mode` chooses how weights and activations are stored:
+        - float32, no quantization
+        - dynamic, int8 weights with float activations
+        - int8, int8 weights and activations throughout, with ranges
+          calibrated on the `representative` images
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if mode == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif mode == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: (
+            [image[np.newaxis].astype(np.float32)] for image in representative
+        )
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8
+        ]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif mode != "float32":
+        raise ValueError(f"Unknown mode: {mode}")
+    return converter.convert()
+
+
+class KerasPredictor():
+    """
+    Predicts category probabilities with a Keras model, calling it directly
+    to avoid the per-call overhead of `Model.predict`.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, images):
+        return self.model(images, training=False).numpy()
+
+
+class TFLitePredictor():
+    """
+    Predicts category probabilities with a TensorFlow Lite model, quantizing
+    inputs and dequantizing outputs for models with integer input/output.
+    """
+
+    def __init__(self, filename, threads=None):
+        self.interpreter = Interpreter(
+            model_path=filename, num_threads=threads
+        )
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch = None
+
+    def predict(self, images):
+
+        # Resize the input tensor only when the batch size changes
+        if len(images) != self.batch:
+            self.interpreter.resize_tensor_input(
+                self.input["index"], (len(images),) + images.shape[1:]
+            )
+            self.interpreter.allocate_tensors()
+            self.batch = len(images)
+
+        scale, zero_point = self.input["quantization"]
+        if self.input["dtype"] != np.float32:
+            info = np.iinfo(self.input["dtype"])
+            images = np.clip(
+                np.round(images / scale + zero_point), info.min, info.max
+            )
+        self.interpreter.set_tensor(
+            self.input["index"], images.astype(self.input["dtype"])
+        )
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+if __name__ == "__main__":
+    main()
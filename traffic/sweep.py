@@ -0,0 +1,188 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Architectures compared by default; each is passed to traffic.build_model
+CANDIDATES = {
+    "baseline": {},
+    "dense128": {"dense_units": 128},
+    "narrow": {"widths": (16, 32), "dense_units": 128},
+    "gap": {"global_pooling": True, "dense_units": 0},
+    "separable": {"separable": True, "dense_units": 128},
+    "separable-gap": {
+        "widths": (32, 64, 128), "separable": True, "global_pooling": True,
+        "dense_units": 0
+    },
+}
+
+# Single-image predictions timed for each candidate
+LATENCY_IMAGES = 200
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Train candidate traffic sign networks in parallel "
+                    "processes and compare their size, cost, CPU latency "
+                    "and accuracy."
+    )
+    parser.add_argument("data_directory")
+    parser.add_argument("--candidates", nargs="+", default=list(CANDIDATES),
+                        choices=list(CANDIDATES))
+    parser.add_argument("--epochs", type=int, default=None,
+                        help="epochs per candidate (default: EPOCHS)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="candidates trained at once")
+    parser.add_argument("--latency-threads", type=int,
+                        default=os.cpu_count(),
+                        help="threads used when timing every candidate's "
+                             "latency (default: all cores)")
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+
+    # Split each machine's cores between the candidates training at once
+    threads = max(1, os.cpu_count() // args.workers)
+    context = multiprocessing.get_context("spawn")
+
+    # Build the image cache once, rather than in every worker at once
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        pool.submit(build_cache, args.data_directory).result()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        jobs = [
+            (name, CANDIDATES[name], args.data_directory, args.epochs,
+             os.path.join(model_dir, f"{name}.h5"))
+            for name in args.candidates
+        ]
+        with ProcessPoolExecutor(
+            args.workers, mp_context=context, initializer=set_threads,
+            initargs=(threads,)
+        ) as pool:
+            results = list(pool.map(run_candidate, jobs))
+
+        # Time latency only once training has finished, one candidate at a
+        # time and with the same threads, so no candidate competes for cores
+        with ProcessPoolExecutor(
+            1, mp_context=context, initializer=set_threads,
+            initargs=(args.latency_threads,)
+        ) as pool:
+            latencies = pool.map(
+                measure_latency,
+                [(args.data_directory, job[-1]) for job in jobs]
+            )
+            for result, latency in zip(results, latencies):
+                result["latency_ms"] = 1000 * latency
+
+    front = pareto_front(results)
+    print(f"{'candidate':<16}{'params':>10}{'MFLOPs':>9}{'ms/image':>10}"
+          f"{'train s':>9}{'accuracy':>10}  pareto")
+    for result in sorted(results, key=lambda result: result["flops"]):
+        print(f"{result['name']:<16}{result['params']:>10}"
+              f"{result['flops'] / 1e6:>9.2f}{result['latency_ms']:>10.2f}"
+              f"{result['train_seconds']:>9.1f}"
+              f"{100 * result['accuracy']:>9.2f}%"
+              f"  {'*' if result['name'] in front else ''}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}.")
+
+
+def build_cache(data_dir):
+    """Build the image cache of `data_dir` if it is missing or out of date."""
+    from traffic import image_reader
+    image_reader(data_dir)
+
+
+def set_threads(threads):
+    """
+    Size TensorFlow's thread pools in a fresh worker process. TensorFlow is
+    imported here so each process sizes its own thread pools.
+    """
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def run_candidate(job):
+    """
+    Train and measure one candidate in a worker process, saving the trained
+    model to `model_path`. Return a dict of its configuration, parameter
+    count, estimated FLOPs, training time and test accuracy.
+    """
+    name, config, data_dir, epochs, model_path = job
+    from traffic import (
+        EPOCHS, SEED, build_model, estimate_flops, load_datasets
+    )
+
+    # Every candidate sees the same split
+    train, test = load_datasets(data_dir, seed=SEED)
+    model = build_model(**config)
+
+    start = time.perf_counter()
+    model.fit(train, epochs=epochs or EPOCHS, verbose=0)
+    train_seconds = time.perf_counter() - start
+    _, accuracy = model.evaluate(test, verbose=0)
+    model.save(model_path)
+
+    print(f"Finished {name}.", file=sys.stderr)
+    return {
+        "name": name,
+        "config": config,
+        "params": model.count_params(),
+        "flops": estimate_flops(model),
+        "train_seconds": train_seconds,
+        "accuracy": float(accuracy)
+    }
+
+
+def measure_latency(job):
+    """
+    Return the mean time, in seconds, the model saved at `model_path` takes
+    to classify one test image of `data_dir` at a time.
+    """
+    data_dir, model_path = job
+    import tensorflow as tf
+    from traffic import SEED, load_datasets
+
+    _, test = load_datasets(data_dir, seed=SEED)
+    images, _ = next(iter(test.unbatch().batch(LATENCY_IMAGES)))
+    model = tf.keras.models.load_model(model_path)
+    model(images[:1], training=False)
+    start = time.perf_counter()
+    for i in range(len(images)):
+        model(images[i:i + 1], training=False)
+    return (time.perf_counter() - start) / len(images)
+
+
+def pareto_front(results):
+    """
+    Return the names of the results that no other result beats on FLOPs,
+    latency and accuracy at once.
+    """
+    costs = np.array([
+        [result["flops"], result["latency_ms"], -result["accuracy"]]
+        for result in results
+    ])
+    front = set()
+    for i, result in enumerate(results):
+        dominated = np.any(
+            np.all(costs <= costs[i], axis=1) & np.any(costs < costs[i], axis=1)
+        )
+        if not dominated:
+            front.add(result["name"])
+    return front
+
+
+if __name__ == "__main__":
+    main()
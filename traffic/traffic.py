@@ -1,79 +1,472 @@
+import argparse
 import cv2
+import hashlib
+import json
 import numpy as np
 import os
+import shutil
 import sys
 import tensorflow as tf
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from sklearn.model_selection import train_test_split
 
+from profiling import TrainingProfiler
+
 EPOCHS = 10
 IMG_WIDTH = 28
 IMG_HEIGHT = 28
 NUM_CATEGORIES = 43
 TEST_SIZE = 0.4
 
+# Seed of the train/test split, so the test images held out while training
+# are known to quantize.py and sweep.py
+SEED = 0
 
-def main():
+# Images per training and evaluation batch
+BATCH_SIZE = 32
 
-    # Check command-line arguments
-    if len(sys.argv) not in [2, 3]:
-        sys.exit("Usage: python traffic.py data_directory [model.h5]")
+# Images decoded by a worker process at a time
+DECODE_CHUNK = 512
 
-    # Get image arrays and labels for all image files
-    images, labels = load_data(sys.argv[1])
-    # breakpoint()
+# Images per file in the preprocessed image cache
+SHARD_SIZE = 4096
 
-    # Split data into training and testing sets
-    labels = tf.keras.utils.to_categorical(labels)
-    x_train, x_test, y_train, y_test = train_test_split(
-        np.array(images), np.array(labels), test_size=TEST_SIZE
+# Bump to invalidate existing image caches
+CACHE_VERSION = 1
+
+
+def main():
+
+    # Check command-line arguments
+    parser = argparse.ArgumentParser(
+        usage="python traffic.py data_directory [model.h5] [options]"
     )
+    parser.add_argument("data_directory")
+    parser.add_argument("model", nargs="?", default=None)
+    parser.add_argument("--profile", metavar="LOG", default=None,
+                        help="append step and epoch timings to this JSON "
+                             "lines file")
+    parser.add_argument("--trace-steps", type=int, nargs=2, default=None,
+                        metavar=("FIRST", "LAST"),
+                        help="capture a TensorFlow profiler trace of these "
+                             "global steps (needs --profile)")
+    parser.add_argument("--trace-dir", default="profile")
+    args = parser.parse_args()
+    if args.trace_steps and not args.profile:
+        parser.error("--trace-steps needs --profile")
+
+    # Stream batches of training and testing images from the data directory
+    train, test = load_datasets(args.data_directory, seed=SEED)
 
     # Get a compiled neural network
     model = get_model()
 
-    # Fit model on training data
-    model.fit(x_train, y_train, epochs=EPOCHS)
+    # Fit model on training data, timing it if asked to
+    callbacks = []
+    if args.profile:
+        profiler = TrainingProfiler(
+            args.profile, trace_steps=args.trace_steps,
+            trace_dir=args.trace_dir
+        )
+        train = profiler.watch(train)
+        callbacks.append(profiler)
+    model.fit(train, epochs=EPOCHS, callbacks=callbacks)
 
     # Evaluate neural network performance
-    model.evaluate(x_test,  y_test, verbose=2)
+    model.evaluate(test, verbose=2)
 
     # Save model to file
-    if len(sys.argv) == 3:
-        filename = sys.argv[2]
-        model.save(filename)
-        print(f"Model saved to {filename}.")
+    if args.model:
+        model.save(args.model)
+        print(f"Model saved to {args.model}.")
+
+
+def load_data(data_dir, dtype=np.float32, workers=None, cache=True):
+    """
+    Load image data from directory `data_dir`.
 
+    Assume `data_dir` has one directory named after each category, numbered
+    0 through NUM_CATEGORIES - 1. Inside each category directory will be some
+    number of image files.
+
+    Return tuple `(images, labels)`. `images` is an array of shape
+    `(n, IMG_HEIGHT, IMG_WIDTH, 3)` holding every readable image, resized.
+    With a floating-point `dtype`, pixel values are scaled to [0, 1]; with
+    np.uint8 they are kept as is. `labels` is an array of the `n` integer
+    categories for the corresponding images.
+
+    Images are decoded and resized by a pool of `workers` processes (one per
+    CPU by default) and copied straight into a single preallocated array.
+    Files that cannot be read as images are skipped.
+
+    Unless `cache` is False, the resized images are saved next to `data_dir`
+    on the first load, and later loads read them from memory-mapped shards
+    instead of decoding every file again. The cache is rebuilt whenever the
+    files in `data_dir` or the image size change.
+    """
+    start = time.perf_counter()
+    paths, categories = image_files(data_dir)
+
+    shards = None
+    if cache:
+        key = cache_key(paths)
+        shards = read_cache(data_dir, key)
+    if shards is not None:
+        source = "cache"
+        images, labels = concatenate(shards, dtype)
+    elif cache:
+        source = "files"
+        pixels, labels = decode_all(paths, categories, np.uint8, workers)
+        try_write_cache(data_dir, key, [(pixels, labels)])
+        images, _ = concatenate([(pixels, labels)], dtype)
+    else:
+        source = "files"
+        images, labels = decode_all(paths, categories, dtype, workers)
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {len(images)} images from {source} in {elapsed:.2f}s "
+          f"({len(images) / elapsed:.0f} images/s), "
+          f"skipped {len(paths) - len(images)} unreadable files",
+          file=sys.stderr)
+    return images, labels
+
+
+def load_datasets(data_dir, batch_size=BATCH_SIZE, cache=True, seed=None,
+                  shard=None):
+    """
+    Return `(train, test)` tf.data pipelines over the images in `data_dir`,
+    yielding batches of float32 images scaled to [0, 1] and one-hot labels.
+
+    Only image indices are split and shuffled; each batch is read when it
+    is needed, in parallel, so memory use does not grow with the dataset.
+    Batches come from the image cache, which is built shard by shard on
+    first use (unless `cache` is False, or the cache cannot be written, in
+    which case they are decoded from the files).
+    A fixed `seed` makes the split the same from run to run.
+
+    If `shard` is a pair `(shards, index)`, the training pipeline only
+    covers shard `index` of `shards` equal, disjoint parts of the training
+    images, for data-parallel training; the split must then be seeded.
+    """
+    read, count = image_reader(data_dir, cache)
+    train, test = split_indices(count, seed)
+    if shard is not None:
+        shards, index = shard
+        train = train[:len(train) // shards * shards][index::shards]
+    return (
+        make_dataset(read, train, batch_size, shuffle=True),
+        make_dataset(read, test, batch_size, shuffle=False)
+    )
+
+
+def split_indices(count, seed=None):
+    """
+    Return arrays of the indices of the training and testing images among
+    `count` images, as split by `load_datasets`.
+    """
+    return train_test_split(
+        np.arange(count), test_size=TEST_SIZE, random_state=seed
+    )
+
+
+def image_reader(data_dir, cache=True):
+    """
+    Return a tuple `(read, count)` for the images in `data_dir`. Calling
+    `read(indices)` returns a uint8 array of the images with those indices,
+    from 0 to `count` - 1, and an array of their labels; images that cannot
+    be decoded are left out.
+
+    Unless `cache` is False, a missing or out-of-date image cache is built
+    first, so that every run after the first reads memory-mapped shards.
+    The cache is written as the images are decoded, holding about one shard
+    in memory at a time. If it cannot be written, images are decoded from
+    the files as they are read.
+    """
+    paths, categories = image_files(data_dir)
+    shards = None
+    if cache:
+        key = cache_key(paths)
+        shards = read_cache(data_dir, key)
+        if shards is None and try_write_cache(
+            data_dir, key, decode_chunks(paths, categories)
+        ):
+            shards = read_cache(data_dir, key)
+
+    if shards is None:
+        def read(indices):
+            pixels, readable = decode_images([paths[i] for i in indices])
+            return pixels, categories[indices][readable]
+        return read, len(paths)
+
+    offsets = np.cumsum([0] + [len(labels) for _, labels in shards])
+    labels = np.concatenate([labels for _, labels in shards])
+
+    def read(indices):
+        indices = np.sort(indices)
+        pixels = np.empty(
+            (len(indices), IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.uint8
+        )
+        shard_ids = np.searchsorted(offsets, indices, side="right") - 1
+        for shard in np.unique(shard_ids):
+            rows = shard_ids == shard
+            pixels[rows] = shards[shard][0][indices[rows] - offsets[shard]]
+        return pixels, labels[indices]
+    return read, len(labels)
+
+
+def make_dataset(read, indices, batch_size, shuffle):
+    """
+    Return a tf.data pipeline that batches `indices`, shuffled each epoch
+    if `shuffle` is True, and reads each batch with `read` in parallel,
+    prefetching ahead of the model.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), reshuffle_each_iteration=True)
+
+    def fetch(batch):
+        pixels, labels = tf.numpy_function(
+            read, [batch], [tf.uint8, tf.int64], stateful=False
+        )
+        pixels.set_shape((None, IMG_HEIGHT, IMG_WIDTH, 3))
+        labels.set_shape((None,))
+        images = tf.cast(pixels, tf.float32) / 255
+        return images, tf.one_hot(labels, NUM_CATEGORIES)
+
+    return (
+        dataset.batch(batch_size)
+        .map(fetch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+
+def decode_all(paths, categories, dtype, workers=None):
+    """
+    Decode and resize every image in `paths` with a pool of `workers`
+    processes, writing them into one preallocated array of `dtype`. Return
+    the readable images and their labels from `categories`.
+    """
+    images = np.empty((len(paths), IMG_HEIGHT, IMG_WIDTH, 3), dtype=dtype)
+    labels = np.empty(len(paths), dtype=np.int64)
+    count = 0
+    for pixels, chunk_labels in decode_chunks(paths, categories, workers):
+        store(images[count:count + len(pixels)], pixels)
+        labels[count:count + len(pixels)] = chunk_labels
+        count += len(pixels)
+    return images[:count], labels[:count]
 
-def load_data(data_dir):
-    images = []
-    labels = []
 
-    # Iterate over each category directory
+def decode_chunks(paths, categories, workers=None):
+    """
+    Yield `(pixels, labels)` for each chunk of DECODE_CHUNK files in
+    `paths`, in order: the uint8 images of the chunk that could be read,
+    decoded by a pool of `workers` processes, and their labels from
+    `categories`. Only two chunks per worker are decoded ahead of the one
+    being yielded, so memory use does not grow with the number of files.
+    """
+    chunks = [
+        (offset, paths[offset:offset + DECODE_CHUNK])
+        for offset in range(0, len(paths), DECODE_CHUNK)
+    ]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for offset, chunk in chunks:
+            pixels, readable = decode_images(chunk)
+            yield pixels, categories[offset:offset + DECODE_CHUNK][readable]
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        chunks = iter(chunks)
+        while True:
+            while len(pending) < 2 * workers:
+                offset, chunk = next(chunks, (None, None))
+                if chunk is None:
+                    break
+                pending.append((offset, pool.submit(decode_images, chunk)))
+            if not pending:
+                break
+            offset, future = pending.popleft()
+            pixels, readable = future.result()
+            yield pixels, categories[offset:offset + DECODE_CHUNK][readable]
+
+
+def concatenate(shards, dtype):
+    """
+    Join a list of (pixels, labels) shards into one array of images of
+    `dtype` and one array of labels.
+    """
+    total = sum(len(labels) for _, labels in shards)
+    images = np.empty((total, IMG_HEIGHT, IMG_WIDTH, 3), dtype=dtype)
+    labels = np.empty(total, dtype=np.int64)
+    count = 0
+    for pixels, shard_labels in shards:
+        store(images[count:count + len(pixels)], pixels)
+        labels[count:count + len(pixels)] = shard_labels
+        count += len(pixels)
+    return images, labels
+
+
+def store(block, pixels):
+    """
+    Copy uint8 `pixels` into `block`, scaling them to [0, 1] if `block`
+    holds floating-point values.
+    """
+    block[...] = pixels
+    if np.issubdtype(block.dtype, np.floating):
+        block /= 255
+
+
+def image_files(data_dir):
+    """
+    Return a list of the files in each category directory of `data_dir`,
+    in a fixed order, and an array of the category of each file.
+    """
+    paths = []
+    categories = []
     for category in range(NUM_CATEGORIES):
         category_dir = os.path.join(data_dir, str(category))
-        
         if not os.path.isdir(category_dir):
             continue
-        
-        # Iterate over each image file in the category directory
-        for filename in os.listdir(category_dir):
-            file_path = os.path.join(category_dir, filename)
-            
-            # Read the image using cv2
-            image = cv2.imread(file_path).astype(np.float64)
-            image /= 255
-            if image is None:
-                continue
-            # Resize the image to the specified dimensions
-            image = cv2.resize(image, (IMG_WIDTH, IMG_HEIGHT))
-            
-            # Append the image and the label to the lists
-            images.append(image)
-            labels.append(category)
+        for filename in sorted(os.listdir(category_dir)):
+            paths.append(os.path.join(category_dir, filename))
+            categories.append(category)
+    return paths, np.array(categories, dtype=np.int64)
+
+
+def decode_images(paths):
+    """
+    Read and resize each image file in `paths`. Return a uint8 array of the
+    images that could be read, and a boolean array marking which paths those
+    were.
+    """
+    pixels = np.empty((len(paths), IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.uint8)
+    readable = np.zeros(len(paths), dtype=bool)
+    count = 0
+    for i, path in enumerate(paths):
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        pixels[count] = cv2.resize(image, (IMG_WIDTH, IMG_HEIGHT))
+        readable[i] = True
+        count += 1
+    return pixels[:count], readable
+
+
+def cache_path(data_dir):
+    """Return the directory in which the images of `data_dir` are cached."""
+    return f"{os.path.normpath(data_dir)}.cache"
+
+
+def cache_key(paths):
+    """
+    Return a dict identifying the image size and the current contents of
+    the files in `paths`; a cache is only used if it was written for the
+    same key.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return {
+        "version": CACHE_VERSION,
+        "width": IMG_WIDTH,
+        "height": IMG_HEIGHT,
+        "files": len(paths),
+        "digest": digest.hexdigest()
+    }
+
+
+def read_cache(data_dir, key):
+    """
+    Return a list of (pixels, labels) shards memory-mapped from the image
+    cache of `data_dir`, or None if there is no cache or it was written for
+    a different `key`.
+    """
+    directory = cache_path(data_dir)
+    try:
+        with open(os.path.join(directory, "key.json")) as f:
+            saved = json.load(f)
+        if saved["key"] != key:
+            return None
+        return [
+            (
+                np.load(os.path.join(directory, f"images-{i:05}.npy"),
+                        mmap_mode="r"),
+                np.load(os.path.join(directory, f"labels-{i:05}.npy"),
+                        mmap_mode="r")
+            )
+            for i in range(saved["shards"])
+        ]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_cache(data_dir, key, chunks):
+    """
+    Save an iterable of uint8 `(pixels, labels)` chunks, of any sizes, as
+    shards of SHARD_SIZE images in the image cache of `data_dir`, replacing
+    any previous cache. Each shard is written as soon as it is full, so only
+    one shard is held in memory. If the cache cannot be written, nothing is
+    left behind and OSError is raised.
+    """
+    directory = cache_path(data_dir)
+    staging = f"{directory}.tmp{os.getpid()}"
+    pixels = np.empty((SHARD_SIZE, IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.uint8)
+    labels = np.empty(SHARD_SIZE, dtype=np.int64)
+    shards = 0
+    filled = 0
+
+    def flush():
+        np.save(os.path.join(staging, f"images-{shards:05}.npy"),
+                pixels[:filled])
+        np.save(os.path.join(staging, f"labels-{shards:05}.npy"),
+                labels[:filled])
+
+    try:
+        os.makedirs(staging, exist_ok=True)
+        for chunk_pixels, chunk_labels in chunks:
+            done = 0
+            while done < len(chunk_labels):
+                take = min(SHARD_SIZE - filled, len(chunk_labels) - done)
+                pixels[filled:filled + take] = chunk_pixels[done:done + take]
+                labels[filled:filled + take] = chunk_labels[done:done + take]
+                filled += take
+                done += take
+                if filled == SHARD_SIZE:
+                    flush()
+                    shards += 1
+                    filled = 0
+        if filled:
+            flush()
+            shards += 1
+        with open(os.path.join(staging, "key.json"), "w") as f:
+            json.dump({"key": key, "shards": shards}, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def try_write_cache(data_dir, key, chunks):
+    """
+    Write the image cache of `data_dir` as `write_cache` does, reporting on
+    stderr rather than raising if it cannot be written, since the images
+    can still be decoded from the files. Return whether the cache was
+    written.
+    """
+    try:
+        write_cache(data_dir, key, chunks)
+    except OSError as e:
+        print(f"Could not cache {data_dir}: {e}", file=sys.stderr)
+        return False
+    return True
 
-    return images, labels
-    
 
 def get_model():
     """
@@ -81,24 +474,45 @@ def get_model():
     `input_shape` of the first layer is `(IMG_WIDTH, IMG_HEIGHT, 3)`.
     The output layer should have `NUM_CATEGORIES` units, one for each category.
     """
+    return build_model()
+
+
+def build_model(widths=(32, 64), dense_units=392, separable=False,
+                global_pooling=False):
+    """
+    Returns a compiled convolutional neural network with one block of two
+    3x3 convolutions, max pooling and dropout for each of `widths` filters.
+
+    If `separable` is True, every convolution after the first is depthwise
+    separable. The last block is flattened, or averaged over the image if
+    `global_pooling` is True, and fed to a hidden layer of `dense_units`
+    units (none if 0) before the output layer. The defaults build the
+    network described in the Readme.
+    """
     model = tf.keras.models.Sequential()
-    model.add(tf.keras.layers.Conv2D(32, (3, 3), padding='same', input_shape=(28, 28, 3)))
-    model.add(tf.keras.layers.Activation('relu'))
-    model.add(tf.keras.layers.Conv2D(32, (3, 3)))
-    model.add(tf.keras.layers.Activation('relu'))
-    model.add(tf.keras.layers.MaxPooling2D(pool_size=(2, 2)))
-    model.add(tf.keras.layers.Dropout(0.25))
-    model.add(tf.keras.layers.Conv2D(64, (3, 3), padding='same'))
-    model.add(tf.keras.layers.Activation('relu'))
-    model.add(tf.keras.layers.Conv2D(64, (3, 3)))
-    model.add(tf.keras.layers.Activation('relu'))
-    model.add(tf.keras.layers.MaxPooling2D(pool_size=(2, 2)))
-    model.add(tf.keras.layers.Dropout(0.25))
-    model.add(tf.keras.layers.Flatten())
-    model.add(tf.keras.layers.Dense(392))
-    model.add(tf.keras.layers.Activation('relu'))
-    model.add(tf.keras.layers.Dropout(0.5))
-    model.add(tf.keras.layers.Dense(43))
+    model.add(tf.keras.Input(shape=(IMG_WIDTH, IMG_HEIGHT, 3)))
+    for block, width in enumerate(widths):
+        for layer, padding in enumerate(['same', 'valid']):
+            if separable and (block, layer) != (0, 0):
+                model.add(tf.keras.layers.SeparableConv2D(
+                    width, (3, 3), padding=padding
+                ))
+            else:
+                model.add(tf.keras.layers.Conv2D(
+                    width, (3, 3), padding=padding
+                ))
+            model.add(tf.keras.layers.Activation('relu'))
+        model.add(tf.keras.layers.MaxPooling2D(pool_size=(2, 2)))
+        model.add(tf.keras.layers.Dropout(0.25))
+    if global_pooling:
+        model.add(tf.keras.layers.GlobalAveragePooling2D())
+    else:
+        model.add(tf.keras.layers.Flatten())
+    if dense_units:
+        model.add(tf.keras.layers.Dense(dense_units))
+        model.add(tf.keras.layers.Activation('relu'))
+        model.add(tf.keras.layers.Dropout(0.5))
+    model.add(tf.keras.layers.Dense(NUM_CATEGORIES))
     model.add(tf.keras.layers.Activation('softmax'))
     opt = tf.keras.optimizers.RMSprop(learning_rate=0.0001, decay=1e-6)
     model.compile(loss='categorical_crossentropy',
@@ -107,6 +521,28 @@ def get_model():
     return model
 
 
+def estimate_flops(model):
+    """
+    Return an estimate of the floating-point operations `model` performs
+    to classify one image, counting a multiply-add as two operations and
+    only convolutional and dense layers.
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.SeparableConv2D):
+            _, height, width, filters = layer.output.shape
+            kernel = np.prod(layer.kernel_size)
+            channels = layer.input.shape[-1]
+            flops += 2 * height * width * channels * (kernel + filters)
+        elif isinstance(layer, tf.keras.layers.Conv2D):
+            _, height, width, filters = layer.output.shape
+            kernel = np.prod(layer.kernel_size)
+            channels = layer.input.shape[-1]
+            flops += 2 * height * width * kernel * channels * filters
+        elif isinstance(layer, tf.keras.layers.Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return int(flops)
+
 
 if __name__ == "__main__":
     main()